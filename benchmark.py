@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import timeit
+import argparse
+import tempfile
+import itertools
+import subprocess
+import numpy as np
+from functools import partial
+from time import perf_counter
+# Components & Constants
+from tsp import TSP, random_routes, batch_fitness, crossover_batch, mutation_batch
+from dataset import parse_xml_map, load_map
+from distance import CoordinateDistance
+from evolutionary_algorithm import EA
+from experimentation import Experimentation
+from utils import list_crossovers, list_mutations, list_replacements
+from constants import PARTIALLY_MAPPED_CROSSOVER, INVERSION, REPLACE_WEAKEST, \
+                      TOURNAMENT_SELECTION, RANK_SELECTION, MAX_EVALUATIONS
+
+# Benchmarks of the solver
+# Every benchmark returns {name: value}: seconds (lower is better) or evaluations per second
+# (names ending with THROUGHPUT, higher is better). The results can be saved as JSON and
+# compared to a baseline: a result worse than baseline by more than the tolerance is a regression
+# All the runs are seeded: the same search trajectories are timed on every version
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+PLOTTING_MODULES = ('matplotlib', 'seaborn')
+THROUGHPUT = 'evaluations/s'
+
+# Commands started in a fresh interpreter (cold start)
+COLD_START_COMMANDS = {
+    'import solver core': [sys.executable, '-c', 'import tsp, population, evolutionary_algorithm'],
+    'import experimentation': [sys.executable, '-c', 'import experimentation, island'],
+    'main.py --help': [sys.executable, 'main.py', '--help'],
+}
+
+# Instances: bundled datasets (TSPLIB optimal tour length) + synthetic instances
+DATASETS = {
+    'burma14': ('datasets/burma14.xml', 3323),
+    'brazil58': ('datasets/brazil58.xml', 25395),
+}
+SYNTHETIC_SIZES = (500, 2000, 5000)
+
+# Operators benchmark: population & batch of the timed calls
+POPULATION_SIZE = 500
+TOURNAMENT_SIZE = 10
+BATCH_PAIRS = 64
+
+# End-to-end benchmark: one fixed configuration (no random parameters)
+CONFIGURATION = dict(population_size=100,
+                     tournament_size=10,
+                     crossover_operator=PARTIALLY_MAPPED_CROSSOVER,
+                     mutation_operator=INVERSION,
+                     replacement_operator=REPLACE_WEAKEST)
+
+def cold_start(repeat):
+    # Best wall-clock time of each command (startup + imports): the least noisy estimate
+    results = {}
+    for name, command in COLD_START_COMMANDS.items():
+        times = []
+        for _ in range(repeat):
+            start_time = perf_counter()
+            subprocess.run(command, cwd=FOLDER, check=True, stdout=subprocess.DEVNULL)
+            times.append(perf_counter() - start_time)
+        results[f'cold start: {name}'] = min(times)
+    return results
+
+def plotting_imports():
+    # Plotting modules loaded by the CLI and the solver without drawing anything (should be none)
+    code = 'import sys, main, experimentation, island, evolutionary_algorithm; ' \
+           f'print(" ".join(module for module in {PLOTTING_MODULES} if module in sys.modules))'
+    output = subprocess.run([sys.executable, '-c', code], cwd=FOLDER, check=True,
+                            capture_output=True, text=True).stdout
+    return output.split()
+
+def best_time(function, repeat):
+    # Best time of one call: every measure runs enough calls to last 0.2 s (timeit.autorange)
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+def synthetic_map(vertex_count, seed=0):
+    # Uniform random cities in a 1000 x 1000 square (EUC_2D costs), the same for every run
+    points = np.random.default_rng(seed).uniform(0, 1000, size=(vertex_count, 2))
+    return f'synthetic-{vertex_count}', CoordinateDistance(points).dense()
+
+def instances(sizes):
+    # (name, map_matrix, optimal fitness or None) of the benchmarked instances
+    for file, optimum in DATASETS.values():
+        yield *load_map(os.path.join(FOLDER, file)), optimum
+    for vertex_count in sizes:
+        yield *synthetic_map(vertex_count), None
+
+def loader(repeat):
+    # XML loader: full parse of the file & load from the .npy cache
+    results = {}
+    for name, (file, _) in DATASETS.items():
+        file = os.path.join(FOLDER, file)
+        results[f'xml loader: parse {name}'] = best_time(partial(parse_xml_map, file), repeat)
+        load_map(file) # Write the cache
+        results[f'xml loader: cached load {name}'] = best_time(partial(load_map, file), repeat)
+    return results
+
+def replace_next(ea, newcomers, operator):
+    return ea.replace(next(newcomers), operator=operator)
+
+def operators(name, map_matrix, repeat):
+    # Per call & batched timings of the operators of a generation
+    results = {}
+    rng = np.random.default_rng(0)
+    ea = EA(name, loaded_map=(name, map_matrix), rng=rng)
+    ea.generate_population_p(POPULATION_SIZE)
+    parent_a, parent_b = ea.population[0], ea.population[1]
+    child = ea.children[0]
+    for operator in list_crossovers:
+        # One call -> two children
+        results[f'{operator} per call ({name})'] = best_time(
+            partial(parent_a.crossover, parent_b, *ea.children, operator=operator,
+                    neighbours=ea.neighbours, rng=rng), repeat)
+    # Mutations in place on an evaluated child (incremental fitness)
+    ea.evaluate([child])
+    for operator in list_mutations:
+        results[f'{operator} per call ({name})'] = best_time(
+            partial(child.mutation, operator=operator, rng=rng), repeat)
+
+    # Batches: BATCH_PAIRS pairs of parents, time per pair (comparable to a call)
+    parents = ea.selection_indices(2 * BATCH_PAIRS, TOURNAMENT_SIZE)
+    parents_a = ea.population.routes[parents[:BATCH_PAIRS]]
+    parents_b = ea.population.routes[parents[BATCH_PAIRS:]]
+    for operator in list_crossovers:
+        results[f'{operator} batched, per pair ({name})'] = best_time(
+            partial(crossover_batch, parents_a, parents_b, operator=operator, map_matrix=map_matrix,
+                    neighbours=ea.neighbours, rng=rng), repeat) / BATCH_PAIRS
+    children = np.concatenate([parents_a, parents_b])
+    for operator in list_mutations:
+        results[f'{operator} batched, per pair ({name})'] = best_time(
+            partial(mutation_batch, children, operator, rng), repeat) / BATCH_PAIRS
+
+    # Replacement: random newcomers (about half of them better than the weakest)
+    routes = random_routes(1024, ea.vertex_count, rng)
+    newcomers = [TSP(map_matrix, route, fitness=cost)
+                 for route, cost in zip(routes, batch_fitness(map_matrix, routes).tolist())]
+    for operator in list_replacements:
+        results[f'EA.replace {operator} ({name})'] = best_time(
+            partial(replace_next, ea, itertools.cycle(newcomers), operator), repeat)
+    for method in (TOURNAMENT_SELECTION, RANK_SELECTION):
+        results[f'EA.tournament_selection {method} ({name})'] = best_time(
+            partial(ea.tournament_selection, TOURNAMENT_SIZE, method), repeat)
+    return results
+
+def end_to_end(name, map_matrix, optimum, evaluations, offspring_per_step, target_gap, target_improvement, repeat):
+    # Evaluations per second of a run with a fixed budget, and
+    # time to reach the target fitness: optimum * (1 + gap) of a bundled dataset,
+    # initial best fitness * (1 - improvement) of a synthetic instance (None: not reached)
+    # Seeded runs -> every repetition is the same search, the best time is kept
+    results = {}
+    for count in offspring_per_step:
+        mode = 'steady-state' if count == 1 else f'batched B={count}'
+        run = partial(Experimentation, name, loaded_map=(name, map_matrix), report_no=1, rng=0,
+                      offspring_per_step=count, **CONFIGURATION)
+        execution_times = []
+        for _ in range(repeat):
+            exp = run(max_evaluations=evaluations)
+            exp.run()
+            execution_times.append(exp.recorder.execution_time)
+        results[f'end-to-end {name} {mode}: {THROUGHPUT}'] = exp.evaluations / min(execution_times)
+        initial_fitness = exp.recorder.improvement_history()[1][0]
+        target = optimum * (1 + target_gap) if optimum else initial_fitness * (1 - target_improvement)
+        execution_times = []
+        for _ in range(repeat):
+            exp = run(max_evaluations=MAX_EVALUATIONS, target_fitness=target)
+            exp.run()
+            execution_times.append(exp.recorder.execution_time)
+        reached = exp.stop_reason == 'target fitness'
+        results[f'end-to-end {name} {mode}: time to target {target:.0f}'] = min(execution_times) if reached else None
+    return results
+
+def compare(results, baseline, tolerance):
+    # Names of the results worse than their baseline
+    regressions = []
+    for name, value in results.items():
+        reference = baseline.get(name)
+        if value is None or reference is None:
+            continue
+        if name.endswith(THROUGHPUT):
+            if value < reference / (1 + tolerance):
+                regressions.append(name)
+        elif value > reference * (1 + tolerance):
+            regressions.append(name)
+    return regressions
+
+def format_value(name, value):
+    if value is None:
+        return 'not reached'
+    if name.endswith(THROUGHPUT):
+        return f'{value:,.0f} evaluations/s'
+    if value < 1e-3:
+        return f'{value * 1e6:.1f} us'
+    if value < 1:
+        return f'{value * 1e3:.1f} ms'
+    return f'{value:.2f} s'
+
+SUITES = ('cold-start', 'operators', 'end-to-end')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks of the Evolutionary Algorithm")
+    parser.add_argument("--suite", help="Benchmarks to run (all by default)", nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument("--repeat", "-r", help="Measures of each timing / runs of each end-to-end benchmark (best time)", type=int, default=5)
+    parser.add_argument("--sizes", help="Cities of the synthetic instances", type=int, nargs='*', default=list(SYNTHETIC_SIZES))
+    parser.add_argument("--evaluations", help="Fitness evaluations of the end-to-end throughput runs", type=int, default=4000)
+    parser.add_argument("--offspring-per-step", help="Modes of the end-to-end runs (1: steady-state, B > 1: batched)", type=int, nargs='+', default=[1, 64])
+    parser.add_argument("--target-gap", help="Time to target of the bundled datasets: optimum * (1 + gap)", type=float, default=0.05)
+    parser.add_argument("--target-improvement", help="Time to target of the synthetic instances: initial best * (1 - improvement)", type=float, default=0.05)
+    parser.add_argument("--output", "-o", help="Save the results to this JSON file", default=None)
+    parser.add_argument("--baseline", "-b", help="Compare the results to this JSON file", default=None)
+    parser.add_argument("--tolerance", "-t", help="Allowed slowdown against the baseline (0.2 = 20%%)", type=float, default=0.2)
+    args = parser.parse_args()
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    output = os.path.abspath(args.output) if args.output else None
+
+    def report(results):
+        for name, value in results.items():
+            line = f'{name:<70} {format_value(name, value):>22}'
+            if baseline.get(name) is not None and value is not None:
+                line += f'  (baseline {format_value(name, baseline[name])}, {value / baseline[name] - 1:+.0%})'
+            print(line, flush=True)
+        return results
+
+    results = {}
+    failed = False
+    if 'cold-start' in args.suite:
+        results.update(report(cold_start(args.repeat)))
+        modules = plotting_imports()
+        if modules:
+            print(f'Plotting modules imported without drawing: {", ".join(modules)}')
+            failed = True
+    if 'operators' in args.suite or 'end-to-end' in args.suite:
+        # Reports, records & dataset cache of the runs go to a scratch folder
+        with tempfile.TemporaryDirectory() as scratch:
+            os.chdir(scratch)
+            if 'operators' in args.suite:
+                results.update(report(loader(args.repeat)))
+            for name, map_matrix, optimum in instances(args.sizes):
+                if 'operators' in args.suite:
+                    results.update(report(operators(name, map_matrix, args.repeat)))
+                if 'end-to-end' in args.suite:
+                    results.update(report(end_to_end(name, map_matrix, optimum, args.evaluations,
+                                                     args.offspring_per_step, args.target_gap,
+                                                     args.target_improvement, args.repeat)))
+            os.chdir(FOLDER)
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f'Regressions (> {args.tolerance:.0%} worse): {", ".join(regressions)}')
+        failed = True
+
+    if output:
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=4)
+    sys.exit(1 if failed else 0)
@@ -2,18 +2,76 @@
 PARTIALLY_MAPPED_CROSSOVER='Partially Mapped Crossover (PMX)'
 SEQUENTIAL_CONSTRUCTIVE_CROSSOVER = 'Sequential Constructive Crossover (SCX)'
 ORDERED_CROSSOVER='Order Crossover (OX)'
+# Selection
+TOURNAMENT_SELECTION='tournament'
+RANK_SELECTION='rank'
+RANK_PRESSURE=1.5 # Linear ranking: weight of the best solution (weakest: 2 - RANK_PRESSURE), in [1, 2)
 # Replace
 REPLACE_WEAKEST='Replace Weakest'
 REPLACE_FIRST_WEAKEST='Replace First Weakest'
 # Mutation
 SINGLE_SWAP_MUTATION='Single Swap Mutation'
 INVERSION='Inversion'
+# Recompute the full fitness after every mutation to check the delta evaluation
+VERIFY_DELTA_EVALUATION=False
+# Number of nearest neighbours kept per vertex (SCX fallback)
+NEIGHBOUR_LIST_SIZE=16
+# Number of nearest neighbours tried by the local search (2-opt/Or-opt)
+LOCAL_SEARCH_NEIGHBOURS=8
+# Initialisation of the population
+RANDOM_INITIALISATION='random'
+NEAREST_NEIGHBOUR_INITIALISATION='nearest-neighbour'
+GREEDY_INITIALISATION='greedy'
+SPACE_FILLING_INITIALISATION='space-filling'
+SEEDED_RATE=0.1 # Part of the population built by nearest neighbour from different starts (the rest is random)
+# Pairs of parents crossed per step: 1 -> steady-state, B > 1 -> batch of B generations at once
+OFFSPRING_PER_STEP=1
+# Island model
+RING='ring'
+FULLY_CONNECTED='full'
+MIGRATION_INTERVAL=100 # Generations between two migrations
+MIGRATION_SIZE=2 # Best solutions sent by each island at every migration
+ISLAND_POLL_INTERVAL=1 # Seconds between two checks of the island processes while waiting for their results
+# Distance (TSPLIB EDGE_WEIGHT_TYPE of the coordinate instances)
+EUC_2D='EUC_2D'
+CEIL_2D='CEIL_2D'
+ATT='ATT'
+GEO='GEO'
+DISTANCE_CACHE_ROWS=1024 # Rows kept in the LRU cache of a lazy (coordinate) distance
+# Convergence records (see recorder.py)
+RECORD_STRIDE=1 # Generations between two samples
+RECORD_BLOCK=4096 # Samples kept in memory before growing the arrays / writing them to the file
+# Fitness cache (see tour_cache.py)
+FITNESS_CACHE_SIZE=0 # Routes kept in the fitness cache (0: no cache)
+CACHED_GENERATIONS_FACTOR=10 # With a fitness cache (hits not charged to the budget): at most 10x the generations of the budget
+# Profiling of the experimentations (see profiler.py)
+PROFILE_PHASES='phases' # Time & calls of every phase of the generations
+PROFILE_CPROFILE='cprofile' # Phases + cProfile of the whole run (pstats file)
 # General
 TERMINATION_CRITERION=10000
+# Termination (None: no limit)
+MAX_EVALUATIONS=2 * (TERMINATION_CRITERION - 1) # 2 children evaluated per generation
+TIME_LIMIT=None # Seconds
+TARGET_FITNESS=None # Stop as soon as the best fitness is lower or equal
+STALL_GENERATIONS=None # Stop after N generations without improvement
+DIVERSITY_THRESHOLD=None # Population converged when its diversity (see EA.diversity) is lower
+DIVERSITY_INTERVAL=100 # Generations between two diversity measures
+STOP='stop'
+RESTART='restart'
+RESTART_KEEP=1 # Best solutions kept by a restart
 REPORT_FOLDER='reports'
+RESULTS_DATABASE='results.db' # Append-only results store in REPORT_FOLDER (see results.py)
+EXPLOIT_TOP_K=100 # Best recorded routes added to the population by --exploit
+CACHE_FOLDER='.cache' # Parsed datasets (see dataset.load_map)
 BRAZIL='brazil58'
 BURMA='burma14'
 # Parameter limits
 POPULATION_RANGE=(100, 1000)
 TOURNAMENT_DIVIDE_RANGE=(4, 100)
 VISUAL_MAP_DATA_RANGE=(0, 1000)
+# Hyper-parameter sweeps (see sweep.py)
+GRID_SWEEP='grid'
+RANDOM_SWEEP='random'
+SWEEP_POPULATION_SIZES=(100, 300, 1000) # Levels of the grid
+SWEEP_TOURNAMENT_DIVISORS=(4, 20, 100) # Tournament size = population size / divisor
+HALVING_RATE=1 # Successive halving: keep 1/rate of the configurations at every rung (1: no early stop)
@@ -0,0 +1,153 @@
+import os
+import hashlib
+import xml.etree.ElementTree as ET
+import numpy as np
+# Components & Constants
+from distance import CoordinateDistance
+from constants import CACHE_FOLDER
+
+def parse_xml_map(file):
+    # Stream the TSPLIB XML file (iterparse): every <vertex> is written into the
+    # preallocated matrix then cleared, the DOM of the whole file is never built
+    country = None
+    map_matrix = None
+    vertex_count = 0 # Count number of vertex
+    graph = None
+    for event, element in ET.iterparse(file, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == 'graph':
+                graph = element
+            continue
+        if element.tag == 'name' and graph is None:
+            country = element.text.strip()
+        elif element.tag == 'vertex':
+            edges = element.findall('edge')
+            if map_matrix is None:
+                # Every vertex has an edge to all the other vertices
+                map_matrix = np.zeros((len(edges) + 1, len(edges) + 1), dtype=np.float64)
+            # Iterate and add all edge's cost to map_matrix (cost = 0 for the same vertex)
+            map_matrix[vertex_count, [int(edge.text) for edge in edges]] = [float(edge.attrib['cost']) for edge in edges]
+            vertex_count += 1 # Count vertex
+            # Free the processed vertex
+            element.clear()
+            if graph is not None:
+                graph.remove(element)
+    return country, map_matrix
+
+def read_values(lines, count):
+    # Read `count` numbers from the lines of a TSPLIB section into a flat array
+    values = np.empty(count, dtype=np.float64)
+    filled = 0
+    for line in lines:
+        numbers = line.split()
+        if not numbers or numbers[0] == 'EOF':
+            break
+        values[filled:filled + len(numbers)] = numbers
+        filled += len(numbers)
+        if filled >= count:
+            break
+    if filled != count:
+        raise ValueError(f'Expected {count} values, read {filled}')
+    return values
+
+def parse_tsplib_map(file, lazy=False):
+    # Plain-text TSPLIB file: coordinates (EUC_2D, CEIL_2D, ATT, GEO) or EXPLICIT weights (FULL_MATRIX / UPPER_ROW)
+    # lazy: keep the coordinates and compute the costs on demand (CoordinateDistance)
+    specification = {}
+    with open(file, 'r') as lines:
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('NODE_COORD_SECTION'):
+                vertex_count = int(specification['DIMENSION'])
+                # Lines of "index x y" -> keep x and y
+                nodes = read_values(lines, 3 * vertex_count).reshape(vertex_count, 3)
+                distance = CoordinateDistance(nodes[:, 1:], specification.get('EDGE_WEIGHT_TYPE'))
+                return specification.get('NAME'), distance if lazy else distance.dense()
+            if line.startswith('EDGE_WEIGHT_SECTION'):
+                vertex_count = int(specification['DIMENSION'])
+                edge_weight_format = specification.get('EDGE_WEIGHT_FORMAT')
+                if edge_weight_format == 'FULL_MATRIX':
+                    map_matrix = read_values(lines, vertex_count * vertex_count).reshape(vertex_count, vertex_count)
+                elif edge_weight_format == 'UPPER_ROW':
+                    # Upper triangle row by row, without the diagonal
+                    values = read_values(lines, vertex_count * (vertex_count - 1) // 2)
+                    map_matrix = np.zeros((vertex_count, vertex_count), dtype=np.float64)
+                    offset = 0
+                    for i in range(vertex_count - 1):
+                        row = values[offset:offset + vertex_count - 1 - i]
+                        map_matrix[i, i + 1:] = row
+                        map_matrix[i + 1:, i] = row
+                        offset += len(row)
+                else:
+                    raise ValueError(f'Unsupported EDGE_WEIGHT_FORMAT: {edge_weight_format}')
+                return specification.get('NAME'), map_matrix
+            # Specification part: "KEY : VALUE"
+            key, _, value = line.partition(':')
+            specification[key.strip()] = value.strip()
+    raise ValueError(f'No NODE_COORD_SECTION or EDGE_WEIGHT_SECTION in {file}')
+
+def parse_map(file, lazy=False):
+    # Parse the dataset (TSPLIB XML or plain text), return the country (name) and the map matrix
+    # (a CoordinateDistance if lazy and the dataset is a coordinate instance)
+    with open(file, 'r') as f:
+        is_xml = f.read(256).lstrip().startswith('<')
+    country, map_matrix = parse_xml_map(file) if is_xml else parse_tsplib_map(file, lazy)
+    # No NAME: the reports are named after the file
+    if not country:
+        country = os.path.splitext(os.path.basename(file))[0]
+    if isinstance(map_matrix, CoordinateDistance):
+        return country, map_matrix
+    # Store the costs as one contiguous float64 array so that
+    # fitness can be computed with fancy indexing instead of Python loops
+    return country, np.ascontiguousarray(map_matrix, dtype=np.float64)
+
+def is_coordinate_instance(file):
+    # Plain-text TSPLIB file whose costs come from the coordinates of the vertices
+    with open(file, 'r') as lines:
+        for line in lines:
+            line = line.strip()
+            if line.startswith('<'):
+                return False # XML
+            if line.endswith('SECTION'):
+                return line.startswith('NODE_COORD_SECTION')
+    return False
+
+def dataset_hash(file):
+    # Hash of the content of the dataset file (key of the cache)
+    digest = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_map(file, rebuild_cache=False, cache_folder=CACHE_FOLDER, lazy=False):
+    # Return the country and the map matrix of the dataset.
+    # The first load writes the parsed matrix (.npy) and the country (.name) to the cache,
+    # the next ones (and the worker processes) memory-map it: no parsing, no copy
+    # lazy: coordinate instances are not expanded to a matrix (nor cached)
+    if lazy and is_coordinate_instance(file):
+        return parse_map(file, lazy=True)
+    key = dataset_hash(file)
+    matrix_file = os.path.join(cache_folder, f'{key}.npy')
+    name_file = os.path.join(cache_folder, f'{key}.name')
+    if not rebuild_cache and os.path.exists(matrix_file) and os.path.exists(name_file):
+        with open(name_file, 'r') as f:
+            country = f.read()
+        return country, np.asarray(np.load(matrix_file, mmap_mode='r'))
+
+    country, map_matrix = parse_map(file)
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+        # Write to temporary files then rename: parallel runs never read a partial file
+        temporary = f'.{os.getpid()}.tmp'
+        with open(matrix_file + temporary, 'wb') as f:
+            np.save(f, map_matrix)
+        with open(name_file + temporary, 'w') as f:
+            f.write(country)
+        os.replace(matrix_file + temporary, matrix_file)
+        os.replace(name_file + temporary, name_file)
+    except OSError:
+        print('Could not write the dataset cache')
+    return country, map_matrix
@@ -0,0 +1,111 @@
+from collections import OrderedDict
+import numpy as np
+# Constants
+from constants import EUC_2D, CEIL_2D, ATT, GEO, DISTANCE_CACHE_ROWS
+
+# Distance providers
+# Everything that needs a cost (fitness, deltas, crossovers, neighbour lists) reads it as
+#   map_matrix[i, j] -> cost of the edges i -> j (scalars or broadcast arrays)
+#   map_matrix[i]    -> costs from i to every vertex
+#   len(map_matrix)  -> number of vertices
+# - Dense backend: the (n x n) float64 NumPy array itself
+# - Coordinate backend: CoordinateDistance, computes the costs on demand
+
+def nint(distance):
+    # TSPLIB nearest integer
+    return np.floor(distance + 0.5)
+
+def euclidean_distance(points_a, points_b):
+    return nint(np.hypot(points_a[..., 0] - points_b[..., 0], points_a[..., 1] - points_b[..., 1]))
+
+def ceil_distance(points_a, points_b):
+    return np.ceil(np.hypot(points_a[..., 0] - points_b[..., 0], points_a[..., 1] - points_b[..., 1]))
+
+def pseudo_euclidean_distance(points_a, points_b):
+    # ATT: pseudo-Euclidean distance, rounded up
+    r = np.sqrt(((points_a[..., 0] - points_b[..., 0]) ** 2 + (points_a[..., 1] - points_b[..., 1]) ** 2) / 10.0)
+    t = nint(r)
+    return np.where(t < r, t + 1, t)
+
+def geographical_distance(points_a, points_b):
+    # GEO: points are (latitude, longitude) in radians (see geographical_radians)
+    q1 = np.cos(points_a[..., 1] - points_b[..., 1])
+    q2 = np.cos(points_a[..., 0] - points_b[..., 0])
+    q3 = np.cos(points_a[..., 0] + points_b[..., 0])
+    cosine = np.clip(0.5 * ((1.0 + q1) * q2 - (1.0 - q1) * q3), -1.0, 1.0)
+    return np.trunc(6378.388 * np.arccos(cosine) + 1.0)
+
+def geographical_radians(coordinates):
+    # TSPLIB GEO coordinates are DDD.MM (degrees.minutes)
+    degrees = np.trunc(coordinates)
+    minutes = coordinates - degrees
+    return 3.141592 * (degrees + 5.0 * minutes / 3.0) / 180.0
+
+distance_functions = {
+    EUC_2D: euclidean_distance,
+    CEIL_2D: ceil_distance,
+    ATT: pseudo_euclidean_distance,
+    GEO: geographical_distance
+}
+
+class CoordinateDistance:
+    # Coordinate backend: O(n) memory instead of O(n^2).
+    # Costs are computed on the fly (vectorized over the whole route),
+    # the rows read by map_matrix[i] (nearest vertex fallbacks of SCX     # the rows read by map_matrix[i] are kept in a bounded LRU cache the constructive
+    # initialisations) are kept in a bounded LRU cache
+    def __init__(self, coordinates, edge_weight_type=EUC_2D, cache_rows=DISTANCE_CACHE_ROWS):
+        if edge_weight_type not in distance_functions:
+            raise ValueError(f'Unsupported EDGE_WEIGHT_TYPE: {edge_weight_type}')
+        self.edge_weight_type = edge_weight_type
+        self.distance_function = distance_functions[edge_weight_type]
+        self.points = np.asarray(coordinates, dtype=np.float64)
+        if edge_weight_type == GEO:
+            self.points = geographical_radians(self.points)
+        self.cache_rows = cache_rows
+        self.rows = OrderedDict()
+
+    def __len__(self):
+        return len(self.points)
+
+    @property
+    def shape(self):
+        return (len(self.points), len(self.points))
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            return self.row(int(key))
+        i, j = key
+        # Single source vertex: read from its row if it is already cached
+        # (only the row-wise reads fill the cache: a scalar cost must stay O(1))
+        if self.rows and np.ndim(i) == 0:
+            row = self.rows.get(int(i))
+            if row is not None:
+                return row[j]
+        return self.distance(i, j)
+
+    def distance(self, i, j):
+        i = np.asarray(i)
+        j = np.asarray(j)
+        costs = self.distance_function(self.points[i], self.points[j])
+        # Same vertex -> cost = 0 (like the diagonal of the dense matrix)
+        return np.where(i == j, 0.0, costs)
+
+    def row(self, i):
+        if i in self.rows:
+            self.rows.move_to_end(i)
+            return self.rows[i]
+        row = self.distance(i, np.arange(len(self.points)))
+        if self.cache_rows:
+            self.rows[i] = row
+            if len(self.rows) > self.cache_rows:
+                self.rows.popitem(last=False) # Least recently used
+        return row
+
+    def dense(self, rows=256):
+        # Full (n x n) matrix, computed by blocks of rows
+        vertex_count = len(self.points)
+        map_matrix = np.empty((vertex_count, vertex_count), dtype=np.float64)
+        columns = np.arange(vertex_count)
+        for start in range(0, vertex_count, rows):
+            map_matrix[start:start + rows] = self.distance(columns[start:start + rows, None], columns)
+        return map_matrix
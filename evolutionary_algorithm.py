@@ -1,37 +1,48 @@
-import csv
-import random
-import xml.etree.ElementTree as ET
+import numpy as np
 # Components & Constants
-from tsp import TSP
-from utils import best_fitness
-from constants import REPLACE_WEAKEST, REPLACE_FIRST_WEAKEST, REPORT_FOLDER
+from tsp import TSP, batch_fitness, crossover_batch, mutation_batch, neighbour_lists, default_rng
+from population import Population, route_dtype
+from dataset import load_map
+from local_search import local_search
+from results import ResultStore
+from initialisation import initial_routes
+from tour_cache import FitnessCache, route_key, route_keys
+from constants import REPLACE_WEAKEST, REPLACE_FIRST_WEAKEST, EXPLOIT_TOP_K, LOCAL_SEARCH_NEIGHBOURS, \
+                      RANDOM_INITIALISATION, TOURNAMENT_SELECTION, RANK_SELECTION, RANK_PRESSURE, \
+                      RESTART_KEEP, VERIFY_DELTA_EVALUATION, FITNESS_CACHE_SIZE
 
 class EA:
-    def __init__(self, file: str) -> None:
-        self.map_matrix = [] # 2D Array contains cost of the edges between vertices
-        self.vertex_count = 0 # Count number of vertex
-        self.population = [] # Population of solution
-
-        ############################################
-        # Extract data from xml file to map_matrix #
-        ############################################
-        tree = ET.parse(file)
-        root = tree.getroot()
-        self.country = root.find('name').text
-        # Find all the vertex element
-        # Map all edges to 2D Matrix
-        for vertex in root.findall(".//vertex"):
-            self.map_matrix.append([])
-            flag = True
-            # Iterate and add all edge's cost to map_matrix
-            for edge in vertex.findall("./edge"):
-                # Add edge's cost = 0, if it is the same vertex
-                if flag and type(edge.text) == str and int(edge.text) > self.vertex_count:
-                    self.map_matrix[self.vertex_count].append(0)
-                    flag = False # Turn off the flag to run only once
-                self.map_matrix[self.vertex_count].append(float(edge.attrib['cost']))
-            self.vertex_count += 1 # Count vertex
-        self.map_matrix[-1].append(0)
+    def __init__(self, file: str, loaded_map=None, rng=None,
+                 fitness_cache=FITNESS_CACHE_SIZE, reject_duplicates=False) -> None:
+        # loaded_map: (country, map_matrix) already returned by load_map -> skip parsing the file
+        # rng: generator of the run (numpy.random.Generator) drawing every random choice of the EA
+        # fitness_cache: routes kept in the fitness cache (0: no cache, see tour_cache.py)
+        # reject_duplicates: never insert a route that is already in the population
+        self.rng = default_rng(rng)
+        self.country, self.map_matrix = loaded_map if loaded_map else load_map(file)
+        self.vertex_count = len(self.map_matrix) # Count number of vertex
+
+        # Sorted nearest neighbours of every vertex (nested lists for fast scalar access)
+        self.neighbours = neighbour_lists(self.map_matrix).tolist()
+        # Candidate lists of the local search (closest neighbours only)
+        self.candidates = [neighbours[:LOCAL_SEARCH_NEIGHBOURS] for neighbours in self.neighbours]
+
+        # Population of solution (one preallocated matrix of routes + fitness vector)
+        self.population = Population(self.map_matrix)
+        self.fitness_cache = FitnessCache(fitness_cache) if fitness_cache else None
+        self.reject_duplicates = reject_duplicates
+        self.rejected = 0 # Duplicates not inserted
+        if reject_duplicates:
+            self.population.track_routes()
+        # Rank selection (see rank_indices): solutions sorted by fitness & cumulative rank weights,
+        # kept until the population changes
+        self.rank_order = np.empty(0, dtype=np.intp)
+        self.rank_weights = np.empty(0)
+        self.rank_version = None
+        # Reusable scratch rows that the operators write the two children into
+        self.offspring = np.empty((2, self.vertex_count), dtype=route_dtype(self.vertex_count))
+        self.children = (TSP(self.map_matrix, self.offspring[0], evaluate=False),
+                         TSP(self.map_matrix, self.offspring[1], evaluate=False))
 
     def __str__(self):
         result = ''
@@ -40,52 +51,221 @@ class EA:
         return result
 
     def generate_random_population_p(self, p):
-        for _ in range(p):
-            random_tsp = TSP(self.map_matrix)
-            self.population.append(random_tsp)
+        self.generate_population_p(p, RANDOM_INITIALISATION)
+
+    def generate_population_p(self, p, method=RANDOM_INITIALISATION):
+        if p <= 0:
+            return
+        # Generate all the routes first (see initialisation.py) and score them in one batch
+        routes = initial_routes(method, p, self.map_matrix, self.neighbours, self.rng)
+        fitness = self.evaluate_batch(routes)
+        self.population.reserve(len(self.population) + p)
+        self.population.extend(routes, fitness)
+
+    def evaluate(self, solutions):
+        # Calculate fitness of all the unevaluated solutions at once (the others keep theirs)
+        solutions = [solution for solution in solutions if solution.fitness is None]
+        if len(solutions) == 0:
+            return
+        fitness = self.evaluate_batch([solution.route for solution in solutions])
+        for solution, cost in zip(solutions, fitness.tolist()):
+            solution.fitness = cost
+
+    def crossover(self, parent_a, parent_b, operator):
+        # Cross two parents into the scratch rows (see children), return the two children
+        return parent_a.crossover(parent_b, *self.children, operator=operator, neighbours=self.neighbours, rng=self.rng)
+
+    def mutation(self, solution, operator, verify=VERIFY_DELTA_EVALUATION):
+        # Mutate the solution in place (incremental fitness if it is evaluated)
+        return solution.mutation(operator=operator, verify=verify, rng=self.rng)
+
+    def crossover_batch(self, parents_a, parents_b, operator):
+        # Cross every pair of parent indices, return the two matrices of children
+        routes = self.population.routes
+        return crossover_batch(routes[parents_a], routes[parents_b], operator=operator,
+                               map_matrix=self.map_matrix, neighbours=self.neighbours, rng=self.rng)
+
+    def mutation_batch(self, routes, operator):
+        # Mutate every route (row) in place
+        return mutation_batch(routes, operator, self.rng)
+
+    def evaluate_batch(self, routes):
+        # Fitness of every route (row), read from the fitness cache when the route is known
+        if self.fitness_cache:
+            return self.fitness_cache.evaluate(self.map_matrix, routes, route_keys(routes))
+        return batch_fitness(self.map_matrix, routes)
+
+    def is_duplicate(self, route):
+        # Route already in the population (in any rotation / direction) while rejecting duplicates
+        if self.reject_duplicates and self.population.contains(route_key(route)):
+            self.rejected += 1
+            return True
+        return False
 
     def generate_best_population(self):
-        # Open and read the final report CSV file
-        try:
-            with open(f'{REPORT_FOLDER}/report_{self.country}.csv', 'r', newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    try:
-                        solution = [int(vertex) for vertex in row['Optimize route'][1:-1].split(',')]
-                        tsp = TSP(self.map_matrix, solution)
-                        self.population.append(tsp)
-                    except:
-                        random_tsp = TSP(self.map_matrix)
-                        self.population.append(random_tsp)
-        except:
+        # Add the best recorded routes (results store, fitness index)
+        store = ResultStore()
+        routes = store.top_routes(self.country, EXPLOIT_TOP_K)
+        store.close()
+        if not routes:
             print('No recorded solutions')
+            return
+        routes = np.array(routes)
+        self.population.extend(routes, batch_fitness(self.map_matrix, routes))
+
+    def tournament_selection(self, tournament_size, method=TOURNAMENT_SELECTION):
+        # Select the two parents of a generation
+        # (indices drawn on the fitness vector, no TSP objects compared)
+        indices = self.selection_indices(2, tournament_size, method)
+        if indices is None:
+            return None, None
+        return self.population[indices[0]], self.population[indices[1]]
 
-    def tournament_selection(self, tournament_size):
-        # Select best fitness in tournament selection
-        parent_a = best_fitness(random.sample(self.population, tournament_size))
-        parent_b = best_fitness(random.sample(self.population, tournament_size))
-        return parent_a, parent_b
+    def selection_indices(self, count, tournament_size, method=TOURNAMENT_SELECTION):
+        # Indices of `count` selected parents
+        if method == TOURNAMENT_SELECTION:
+            return self.tournament_indices(count, tournament_size)
+        elif method == RANK_SELECTION:
+            return self.rank_indices(count)
+        raise ValueError(f'Unknown selection: {method}')
+
+    def tournament_indices(self, count, tournament_size):
+        # Winners of `count` tournaments at once: one row of random indices (with replacement)
+        # per tournament, the winner is the argmin of the fitness along the row
+        size = len(self.population)
+        if tournament_size <= 0 or size == 0:
+            return None
+        contestants = self.rng.integers(0, size, size=(count, tournament_size))
+        winners = np.argmin(self.population.fitness[contestants], axis=1)
+        return contestants[np.arange(count), winners]
+
+    def rank_indices(self, count):
+        # Rank-based selection: linear ranking weights (best: RANK_PRESSURE, weakest: 2 - RANK_PRESSURE)
+        # A rank is drawn on the cumulative weights (O(log P) per draw), then mapped to its solution
+        # by the fitness order. The order is only sorted again when the population changed, from the
+        # previous order (nearly sorted after a few replacements -> ~O(P) timsort)
+        size = len(self.population)
+        if size == 0:
+            return None
+        if self.rank_version != self.population.version:
+            fitness = self.population.fitness[:size]
+            if len(self.rank_order) == size:
+                self.rank_order = self.rank_order[np.argsort(fitness[self.rank_order], kind='stable')]
+            else:
+                self.rank_order = np.argsort(fitness, kind='stable')
+                self.rank_weights = np.cumsum(RANK_PRESSURE - 2 * (RANK_PRESSURE - 1) * np.arange(size) / max(size - 1, 1))
+            self.rank_version = self.population.version
+        ranks = np.searchsorted(self.rank_weights, self.rng.random(count) * self.rank_weights[-1], side='right')
+        # The two parents of a pair (first half, second half) are distinct solutions
+        half = count // 2
+        same = np.flatnonzero(ranks[:half] == ranks[half:2 * half]) if size > 1 else []
+        while len(same):
+            ranks[half + same] = np.searchsorted(self.rank_weights, self.rng.random(len(same)) * self.rank_weights[-1], side='right')
+            same = same[ranks[same] == ranks[half + same]]
+        return self.rank_order[np.minimum(ranks, size - 1)]
 
     def replace(self, new_solution, operator=REPLACE_WEAKEST):
         # Replace solution with the weakest fitness
         if operator == REPLACE_WEAKEST:
-            weakest_solution_index = None
-            for i, solution in enumerate(self.population):
-                if (not weakest_solution_index) or \
-                   (self.population[i] > self.population[weakest_solution_index]):
-                    weakest_solution_index = i
-            if weakest_solution_index and self.population[weakest_solution_index] > new_solution:
+            weakest_solution_index = self.population.weakest_index()
+            if weakest_solution_index is not None and \
+               self.population.fitness[weakest_solution_index] > new_solution.fitness and \
+               not self.is_duplicate(new_solution.route):
                 self.population[weakest_solution_index] = new_solution
             return weakest_solution_index
         # Replace first solution with weaker fitness
         elif operator == REPLACE_FIRST_WEAKEST:
-            for i, solution in enumerate(self.population):
-                if solution > new_solution:
-                    self.population[i] = new_solution
-                    return i
-                
+            first_weaker_index = self.population.first_weaker_index(new_solution.fitness)
+            if first_weaker_index is not None and not self.is_duplicate(new_solution.route):
+                self.population[first_weaker_index] = new_solution
+            return first_weaker_index
+
+    def merge(self, routes, fitness, operator=REPLACE_WEAKEST):
+        # Insert a batch of evaluated routes (one per row)
+        size = len(self.population)
+        if size == 0:
+            return
+        if operator == REPLACE_WEAKEST:
+            # The best `size` of population + new routes survive (one argpartition),
+            # the new survivors take the rows of the dropped solutions
+            merged = np.concatenate([self.population.fitness[:size], fitness])
+            survivors = np.argpartition(merged, size - 1)[:size]
+            kept = survivors[survivors >= size] - size
+            if len(kept):
+                dropped = np.setdiff1d(np.arange(size), survivors, assume_unique=True)
+                if self.reject_duplicates:
+                    # Surviving routes already in the population (or earlier in the batch) are not
+                    # inserted, the weakest dropped solutions are replaced by the remaining ones
+                    keys = route_keys(routes[kept])
+                    seen = set()
+                    unique = []
+                    for k, key in enumerate(keys):
+                        if key in seen or self.population.contains(key):
+                            self.rejected += 1
+                        else:
+                            unique.append(k)
+                        seen.add(key)
+                    kept = kept[unique]
+                    dropped = dropped[np.argsort(-self.population.fitness[dropped], kind='stable')[:len(kept)]]
+                self.population.assign(dropped, routes[kept], fitness[kept])
+        elif operator == REPLACE_FIRST_WEAKEST:
+            # Depends on the order of the insertions -> one route after another
+            for route, cost in zip(routes, np.asarray(fitness).tolist()):
+                self.replace(TSP(self.map_matrix, route, fitness=cost), operator=operator)
+
+    def improve(self, solution):
+        # Local search (2-opt & Or-opt) on the solution, in place
+        route, solution.fitness = local_search(solution.route, solution.fitness, self.map_matrix, self.candidates)
+        solution.route[:] = route
+        return solution
+
+    def improve_batch(self, routes, fitness):
+        # Local search on every route (row), in place
+        for k in range(len(routes)):
+            route, fitness[k] = local_search(routes[k], fitness[k], self.map_matrix, self.candidates)
+            routes[k] = route
+
+    def diversity(self):
+        # Mean fraction of the edges of a solution that are not in the best solution:
+        # 0 -> the whole population has converged on the best route. O(P * n)
+        size = len(self.population)
+        if size == 0:
+            return 0.0
+        best = self.population.routes[self.population.best_index()]
+        successor = np.empty(self.vertex_count, dtype=np.intp)
+        predecessor = np.empty(self.vertex_count, dtype=np.intp)
+        successor[best] = np.roll(best, -1)
+        predecessor[best] = np.roll(best, 1)
+        routes = self.population.routes[:size]
+        following = np.roll(routes, -1, axis=1)
+        shared = (successor[routes] == following) | (predecessor[routes] == following)
+        return 1.0 - float(shared.mean())
+
+    def restart(self, keep=RESTART_KEEP, method=RANDOM_INITIALISATION):
+        # Keep the `keep` best solutions and generate the others again
+        # Return the number of fitness evaluations (routes read from the fitness cache excluded)
+        size = len(self.population)
+        keep = min(keep, size)
+        if keep == size:
+            return 0
+        order = np.argpartition(self.population.fitness[:size], keep - 1) if keep else np.arange(size)
+        replaced = order[keep:]
+        routes = initial_routes(method, len(replaced), self.map_matrix, self.neighbours, self.rng)
+        hits = self.fitness_cache.hits if self.fitness_cache else 0
+        self.population.assign(replaced, routes, self.evaluate_batch(routes))
+        return len(replaced) - (self.fitness_cache.hits - hits if self.fitness_cache else 0)
+
+    def best_solutions(self, k):
+        # k solutions with the best fitness (detached copies, e.g. migrants of an island)
+        size = len(self.population)
+        k = min(k, size)
+        if k <= 0:
+            return []
+        indices = np.argpartition(self.population.fitness[:size], k - 1)[:k]
+        return [self.population[i].copy() for i in indices]
+
     def best_solution(self) -> TSP:
-        result = best_fitness(self.population)
+        result = self.population.best()
         if result:
             return result
-        return TSP(map_matrix=self.map_matrix)
+        return TSP(map_matrix=self.map_matrix, rng=self.rng)
@@ -1,205 +1,342 @@
 import os
-import random
-import matplotlib.pyplot as plt
-import seaborn as sns
-from time import time
+import cProfile
+import numpy as np
+from time import time, perf_counter_ns
+from contextlib import contextmanager
 # Components & Constants
 from evolutionary_algorithm import EA
-from constants import BRAZIL, REPORT_FOLDER, \
-                      TERMINATION_CRITERION, \
+from recorder import Recorder
+from profiler import PhaseTimer
+from render import render_experimentation
+from dataset import load_map
+from constants import REPORT_FOLDER, \
                       POPULATION_RANGE, \
                       TOURNAMENT_DIVIDE_RANGE, \
-                      VISUAL_MAP_DATA_RANGE
+                      VISUAL_MAP_DATA_RANGE, \
+                      VERIFY_DELTA_EVALUATION, \
+                      RANDOM_INITIALISATION, \
+                      OFFSPRING_PER_STEP, \
+                      TOURNAMENT_SELECTION, \
+                      MAX_EVALUATIONS, TIME_LIMIT, TARGET_FITNESS, STALL_GENERATIONS, \
+                      DIVERSITY_THRESHOLD, DIVERSITY_INTERVAL, STOP, RESTART, \
+                      RECORD_STRIDE, PROFILE_CPROFILE, FITNESS_CACHE_SIZE, \
+                      CACHED_GENERATIONS_FACTOR
 from utils import list_mutations, list_crossovers, list_replacements
 
 class Experimentation:
-    def __init__(self, dataset, exploit_evolutionary_algorithm=None):
+    def __init__(self, dataset, exploit_evolutionary_algorithm=None, verify_delta=VERIFY_DELTA_EVALUATION,
+                 loaded_map=None, report_no=None, memetic=False, init=RANDOM_INITIALISATION,
+                 offspring_per_step=OFFSPRING_PER_STEP, selection=TOURNAMENT_SELECTION,
+                 max_evaluations=MAX_EVALUATIONS, time_limit=TIME_LIMIT, target_fitness=TARGET_FITNESS,
+                 stall_generations=STALL_GENERATIONS, diversity_threshold=DIVERSITY_THRESHOLD,
+                 on_convergence=STOP, record_stride=RECORD_STRIDE, stream_records=False,
+                 record_name=None, rng=None, population_size=None, tournament_size=None,
+                 crossover_operator=None, mutation_operator=None, replacement_operator=None,
+                 profile=None, fitness_cache=FITNESS_CACHE_SIZE, reject_duplicates=False):
+        self.start_time = time()
+        # Generator of the run: every random choice (parameters, operators, visual data)
+        # is drawn from it -> an experimentation is reproduced from its seed
+        self.rng = np.random.default_rng(rng)
         # Create EA instance to initialise population of solutions
-        # Random the parameters to add randomness to each execution
-        self.ea = EA(dataset)
-        self.population_size = random.randint(*POPULATION_RANGE)
-        self.ea.generate_random_population_p(self.population_size)
+        # Random the parameters to add randomness to each execution (unless they are given)
+        self.ea = EA(dataset, loaded_map=loaded_map, rng=self.rng,
+                     fitness_cache=fitness_cache, reject_duplicates=reject_duplicates)
+        if population_size is None:
+            population_size = int(self.rng.integers(POPULATION_RANGE[0], POPULATION_RANGE[1] + 1))
+        self.population_size = population_size
+        self.init = init # Initialisation of the population
+        self.ea.generate_population_p(self.population_size, init)
         if exploit_evolutionary_algorithm:
             self.ea.generate_best_population()
             self.population_size = len(self.ea.population)
-        self.tournament_size =  round(self.population_size / random.randint(*TOURNAMENT_DIVIDE_RANGE))
-        self.replacement_operator = random.choice(list_replacements)
-        self.mutation_operator = random.choice(list_mutations)
-        self.crossover_operator = random.choice(list_crossovers)
+        if tournament_size is None:
+            tournament_size = round(self.population_size / int(self.rng.integers(TOURNAMENT_DIVIDE_RANGE[0], TOURNAMENT_DIVIDE_RANGE[1] + 1)))
+        self.tournament_size = tournament_size
+        self.replacement_operator = replacement_operator or list_replacements[self.rng.integers(len(list_replacements))]
+        self.mutation_operator = mutation_operator or list_mutations[self.rng.integers(len(list_mutations))]
+        self.crossover_operator = crossover_operator or list_crossovers[self.rng.integers(len(list_crossovers))]
+        self.verify_delta = verify_delta
+        self.memetic = memetic # Local search on the offspring
+        self.offspring_per_step = offspring_per_step # Pairs of parents per step (see advance)
+        self.selection = selection # Tournament or rank-based selection
+        # Termination (see terminated)
+        self.max_evaluations = max_evaluations
+        self.evaluations = 0 # Fitness evaluations since the initial population (cache hits are free)
+        self.time_limit = time_limit
+        self.target_fitness = target_fitness
+        self.stall_generations = stall_generations
+        self.diversity_threshold = diversity_threshold
+        self.on_convergence = on_convergence # Stop or restart when the population has converged
+        self.last_diversity_check = 0
+        self.restarts = 0
+        self.stop_reason = None
         # Add sample data (random) to visualise cities & route
-        self.visualise_data = [
-            (random.randint(*VISUAL_MAP_DATA_RANGE), random.randint(*VISUAL_MAP_DATA_RANGE))
-            for _ in range(self.ea.vertex_count)
-        ]
+        self.visualise_data = self.rng.integers(VISUAL_MAP_DATA_RANGE[0], VISUAL_MAP_DATA_RANGE[1] + 1,
+                                                size=(self.ea.vertex_count, 2))
         # Create report directory
         # Check if report folder for current country is created
         self.report_dir = f'{REPORT_FOLDER}/report_{self.ea.country}'
-        if not os.path.exists(self.report_dir):
-            os.mkdir(self.report_dir)
+        os.makedirs(self.report_dir, exist_ok=True)
         # Generate a new filename for current experimentation's report
         # including name for csv & png files
-        self.report_name = f'report_{round(len(os.listdir(self.report_dir))) + 1}'
-        # Array of data records the solution and 
-        # generation achieving the best fitness at that current generation
-        self.record_best_solution = [{
-            'generation': 0,
-            'solution': self.ea.best_solution(),
-            'execution_time': 0
-        }]
+        # (parallel experimentations get their number from the caller)
+        if report_no is None:
+            report_no = round(len(os.listdir(self.report_dir))) + 1
+        self.report_no = report_no
+        self.report_name = f'report_{report_no}'
+        # Convergence records: samples of the best fitness & execution time,
+        # best routes at every improvement (streamed to the records folder if asked)
+        self.recorder = Recorder(self.ea.best_solution(), self.ea.vertex_count, stride=record_stride,
+                                 folder=f'{REPORT_FOLDER}/records_{self.ea.country}' if stream_records else None,
+                                 name=record_name or self.report_name)
+        # Profiling (see profiling): time of every phase, + cProfile of the run
+        self.profile = profile
+        self.phase_timer = PhaseTimer() if profile else None
+        # (own folder: the files of the report folder number the reports)
+        self.profile_file = None
+        if profile == PROFILE_CPROFILE:
+            profile_dir = f'{REPORT_FOLDER}/profiles_{self.ea.country}'
+            os.makedirs(profile_dir, exist_ok=True)
+            self.profile_file = f'{profile_dir}/{record_name or self.report_name}.pstats'
 
     def __str__(self):
-        return f"""- Population size: {self.population_size}
+        description = f"""- Population size: {self.population_size}
 - Tournament size: {self.tournament_size}
 - Crossover operator: {self.crossover_operator}
 - Mutation operator: {self.mutation_operator}
 - Replacement operator: {self.replacement_operator}"""
+        if self.selection != TOURNAMENT_SELECTION:
+            description += f'\n- Selection: {self.selection}'
+        if self.offspring_per_step > 1:
+            description += f'\n- Offspring per step: {2 * self.offspring_per_step} (batched generations)'
+        if self.init != RANDOM_INITIALISATION:
+            description += f'\n- Initialisation: {self.init}'
+        if self.memetic:
+            description += '\n- Memetic: 2-opt & Or-opt local search'
+        if self.ea.fitness_cache:
+            cache = self.ea.fitness_cache
+            description += f'\n- Fitness cache: {cache.hits} hits / {cache.hits + cache.misses} evaluations ({cache.hit_rate():.1%})'
+        if self.ea.reject_duplicates:
+            description += f'\n- Duplicates rejected: {self.ea.rejected}'
+        if self.restarts:
+            description += f'\n- Restarts: {self.restarts}'
+        # Early stop only (the evaluation budget is the default termination)
+        if self.stop_reason and self.stop_reason != 'evaluation budget':
+            description += f'\n- Stopped: {self.stop_reason} ({self.recorder.generation} generations, {self.evaluations} evaluations)'
+        if self.phase_timer:
+            description += f'\n- Profile ({self.phase_timer.total / 1e9:.2f}s):\n{self.phase_timer.table()}'
+        if self.profile_file:
+            description += f'\n- cProfile: {self.profile_file}'
+        return description
+
+    def render_record(self):
+        # Compact record of the experimentation: everything the render stage needs to draw it
+        generations, fitness = self.recorder.improvement_history()
+        samples = self.recorder.convergence()
+        return {
+            'file': f'{self.report_dir}/{self.report_name}.png',
+            'report_name': self.report_name,
+            'country': self.ea.country,
+            'points': self.visualise_data,
+            'route': np.asarray(self.recorder.best.route, dtype=np.int32),
+            'fitness': self.recorder.best.fitness,
+            'best_generation': self.recorder.best_generation,
+            'last_generation': self.recorder.generation,
+            'improvements': (generations, fitness),
+            'samples': (samples['generation'], samples['elapsed']),
+            'execution_time': self.recorder.execution_time,
+            'population_size': self.population_size,
+            'tournament_size': self.tournament_size,
+            'crossover_operator': self.crossover_operator,
+            'mutation_operator': self.mutation_operator,
+            'replacement_operator': self.replacement_operator
+        }
 
     def visualise(self):
-        # Only visualize the last record (Best fitness)
-        record = self.record_best_solution[-1]
-        best_solution = record['solution']
-        # Create 2x2 plot
-        fig, ax = plt.subplots(2, 2, figsize=(12, 8))
-        fig.suptitle(f"TSP - Experimentation {self.report_name}", wrap=True)
-
-        # Visualise route of best solution
-        x, y = zip(*self.visualise_data)
-        colors = sns.color_palette("husl", self.ea.vertex_count)
-        sns.scatterplot(
-            x=x,
-            y=y,
-            ax=ax[0,0],
-            hue=colors,
-            palette=colors,
-            legend=False,
-            s=100
-        )
-        # Create a scatter plot with sample data points (visualising the map/cities)
-        for i, (x, y) in enumerate(self.visualise_data):
-            ax[0,0].annotate(i, (x, y), textcoords="offset points", xytext=(0, -3), ha='center')
-        # Add route between cities
-        # Draw edges (lines) between data points
-        x1, y1 = self.visualise_data[best_solution.route[0]]
-        x2, y2 = self.visualise_data[best_solution.route[-1]]
-        sns.lineplot(
-            x=[x1, x2],
-            y=[y1, y2],
-            color=colors[-1],
-            linewidth=2,
-            marker='o',
-            markersize=15,
-            markeredgecolor='black',
-            ax=ax[0,0])
-        for i in range(len(self.visualise_data) - 1):
-            x1, y1 = self.visualise_data[best_solution.route[i]]
-            x2, y2 = self.visualise_data[best_solution.route[i + 1]]
-            sns.lineplot(
-                x=[x1, x2],
-                y=[y1, y2],
-                color=colors[i],
-                linewidth=2,
-                marker='o',
-                markersize=15,
-                markeredgecolor='black',
-                ax=ax[0,0])
-        # Add label, title and annotates
-        ax[0,0].set_title(f'Route of best solution {best_solution.fitness}')
-        ax[0,0].set_xlabel(f'Population Size of {self.population_size}')
-        ax[0,0].set_ylabel(f'Tournament Size of {self.tournament_size}')
-
-        # convergence curves
-        list_best_fitness = [record['solution'].fitness for record in self.record_best_solution]
-        sns.lineplot(
-            x=range(TERMINATION_CRITERION),
-            y=list_best_fitness,
-            color='#3274A1',
-            ax=ax[0,1])
-        sns.scatterplot(x=[record['generation']], y=[best_solution.fitness], ax=ax[0,1], color='#E1812C')
-        ax[0,1].annotate(
-            best_solution.fitness,
-            (record['generation'], best_solution.fitness),
-            textcoords="offset points",
-            xytext=(10, 5),
-            ha='center',
-            color='#E1812C')
-        y_offset = 5000 if self.ea.country == BRAZIL else 500
-        # Add a vertical line (from the x-axis to the point)
-        ax[0,1].vlines(x=record['generation'], color='#919AA1', linestyle='--', ymin=best_solution.fitness - y_offset, ymax=best_solution.fitness)
-        # Add a horizontal line (from the y-axis to the point)
-        ax[0,1].hlines(y=best_solution.fitness, color='#919AA1', linestyle='--', xmin=0 ,xmax=record['generation']) 
-        # Add label, title
-        ax[0,1].set_xlabel(f'Generations')
-        ax[0,1].set_ylabel(f'Fitness of the best solution')
-        ax[0,1].set_title('Convergence curves')
-
-        # Visualise execution time
-        sns.lineplot(
-            x=range(0, len(self.record_best_solution)),
-            y=[record['execution_time'] for record in self.record_best_solution],
-            color='#cc241d',
-            ax=ax[1,0])
-        ax[1,0].set_xlabel('Generations')
-        ax[1,0].set_ylabel('Duration (s)')
-        ax[1,0].set_title(f'Execution Time {record["execution_time"]}s')
-
-        # More annotation
-        ax[1,1].set_title('Parameters')
-        route = str(best_solution.route)[1:-1].replace(",", " >")
-        txt = ax[1,1].text(.5,.5,
-                       f'{route}',
-                       ha='center',
-                       wrap=True)
-        txt._get_wrap_line_width = lambda : 400.
-        ax[1,1].annotate(f'Crossover operator: {self.crossover_operator}',
-                       xy=(0.5, 0.4),
-                       xycoords='axes fraction',
-                       ha='center')
-        ax[1,1].annotate(f'Replacement operator: {self.replacement_operator}',
-                       xy=(0.5, 0.3),
-                       xycoords='axes fraction',
-                       ha='center')
-        ax[1,1].annotate(f'Mutation operator: {self.mutation_operator}',
-                       xy=(0.5, 0.2),
-                       xycoords='axes fraction',
-                       ha='center')
-
-        # Save plot
-        plt.tight_layout()
-        plt.savefig(f'{self.report_dir}/{self.report_name}.png')
-        plt.close()
+        # Draw the image of the experimentation now (see render.py)
+        render_experimentation(self.render_record())
 
     def run(self):
-        # Termination criterion: 10,000 fitness evaluations
-        for i in range(1, TERMINATION_CRITERION):
-            start_time = time()
-
-            # Tournament Selection
-            parent_a, parent_b = self.ea.tournament_selection(self.tournament_size)
-
-            if parent_a and parent_b:
-                # Crossover
-                child_c, child_d = parent_a.crossover(parent_b, operator=self.crossover_operator)
-
-                # Mutation
-                new_solution_e = child_c.mutation(operator=self.mutation_operator) # Record new solution E
-                new_solution_f = child_d.mutation(operator=self.mutation_operator) # Record new solution F
-
-                # Replacement
-                self.ea.replace(new_solution_e, operator=self.replacement_operator)
-                self.ea.replace(new_solution_f, operator=self.replacement_operator)
-            
-            # Record best solution, execution time and period/generation to achieve such solution
-            best_solution = self.ea.best_solution()
-            end_time = time()
-            if best_solution >= self.record_best_solution[i - 1]['solution']:
-                self.record_best_solution.append({
-                    'generation': self.record_best_solution[i - 1]['generation'],
-                    'solution': self.record_best_solution[i - 1]['solution'],
-                    'execution_time': self.record_best_solution[i - 1]['execution_time'] + (end_time - start_time)
-                })
-            else:
-                self.record_best_solution.append({
-                    'generation': i,
-                    'solution': best_solution,
-                    'execution_time': self.record_best_solution[i - 1]['execution_time'] + (end_time - start_time)
-                })
+        # Termination criterion: 10,000 generations (2 fitness evaluations each) by default
+        with self.profiling():
+            i = 1
+            while not self.terminated(i):
+                i = self.advance(i)
+        self.recorder.finish()
+
+    @contextmanager
+    def profiling(self):
+        # Time the phases of the generations run in the block (and cProfile it if asked)
+        # Nothing is wrapped when profiling is off
+        if not self.profile:
+            yield
+            return
+        timer = self.phase_timer
+        for owner, attribute, phase in [
+            (self.ea, 'tournament_selection', 'selection'),
+            (self.ea, 'selection_indices', 'selection'),
+            (self.ea, 'crossover', 'crossover'),
+            (self.ea, 'crossover_batch', 'crossover'),
+            (self.ea, 'mutation', 'mutation'),
+            (self.ea, 'mutation_batch', 'mutation'),
+            (self.ea, 'evaluate', 'evaluation'),
+            (self.ea, 'evaluate_batch', 'evaluation'),
+            (self.ea, 'improve', 'local search'),
+            (self.ea, 'improve_batch', 'local search'),
+            (self.ea, 'replace', 'replacement'),
+            (self.ea, 'merge', 'replacement'),
+            (self, 'record', 'record'),
+            (self, 'terminated', 'termination')]:
+            timer.wrap(owner, attribute, phase)
+        profile = cProfile.Profile() if self.profile_file else None
+        start = perf_counter_ns()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+                profile.dump_stats(self.profile_file)
+            timer.total += perf_counter_ns() - start
+            timer.unwrap()
+
+    def advance(self, i):
+        # Execute generation i (steady-state) or a batch of generations from i
+        # Return the next generation
+        count = min(self.offspring_per_step, (self.max_evaluations - self.evaluations) // 2)
+        cache = self.ea.fitness_cache
+        hits = cache.hits if cache else 0
+        if count > 1:
+            self.batch_step(i, count)
+        else:
+            count = 1
+            self.step(i)
+        # Every child uses the budget, except the ones read from the cache
+        # (children evaluated by the crossover, see step, are not looked up in the cache)
+        self.evaluations += 2 * count - (cache.hits - hits if cache else 0)
+        return i + count
+
+    def terminated(self, i):
+        # Check the termination criteria before generation i
+        # (the reason is kept in stop_reason), restart a converged population if asked
+        best_fitness = self.recorder.best.fitness
+        if self.evaluations + 2 > self.max_evaluations:
+            self.stop_reason = 'evaluation budget'
+        elif self.ea.fitness_cache and i - 1 >= CACHED_GENERATIONS_FACTOR * (self.max_evaluations // 2):
+            # A converged population can produce cached children only: the budget would never be used
+            self.stop_reason = 'generation limit'
+        elif self.time_limit is not None and time() - self.start_time >= self.time_limit:
+            self.stop_reason = 'time limit'
+        elif self.target_fitness is not None and best_fitness <= self.target_fitness:
+            self.stop_reason = 'target fitness'
+        elif self.stall_generations is not None and \
+             i - 1 - self.recorder.best_generation >= self.stall_generations:
+            self.stop_reason = 'stalled'
+        elif self.diversity_threshold is not None and i - self.last_diversity_check >= DIVERSITY_INTERVAL:
+            self.last_diversity_check = i
+            if self.ea.diversity() < self.diversity_threshold:
+                # A restart needs the evaluations of the new solutions
+                if self.on_convergence == RESTART and \
+                   self.evaluations + len(self.ea.population) <= self.max_evaluations:
+                    self.evaluations += self.ea.restart(method=self.init)
+                    self.restarts += 1
+                else:
+                    self.stop_reason = 'converged'
+        return self.stop_reason is not None
+
+    def step(self, i):
+        # Execute generation i
+        # Tournament Selection
+        parent_a, parent_b = self.ea.tournament_selection(self.tournament_size, self.selection)
+
+        if parent_a and parent_b:
+            # Crossover
+            child_c, child_d = self.ea.crossover(parent_a, parent_b, operator=self.crossover_operator)
+
+            # Mutation: O(1) delta evaluation of the children evaluated by the crossover (SCX),
+            # the others are evaluated once after the mutation (one batch)
+            new_solution_e = self.ea.mutation(child_c, operator=self.mutation_operator, verify=self.verify_delta) # Record new solution E
+            new_solution_f = self.ea.mutation(child_d, operator=self.mutation_operator, verify=self.verify_delta) # Record new solution F
+            self.ea.evaluate([new_solution_e, new_solution_f])
+
+            # Memetic stage: local search on the new solutions
+            if self.memetic:
+                self.ea.improve(new_solution_e)
+                self.ea.improve(new_solution_f)
+
+            # Replacement
+            self.ea.replace(new_solution_e, operator=self.replacement_operator)
+            self.ea.replace(new_solution_f, operator=self.replacement_operator)
+
+        self.record(i)
+
+    def batch_step(self, i, count):
+        # Execute the generations i to i + count - 1 at once:
+        # `count` pairs of parents -> 2 * count children, evaluated and merged in one pass
+        # (same number of fitness evaluations as `count` steady-state generations)
+
+        # Tournament Selection (first half: parents A, second half: parents B)
+        parents = self.ea.selection_indices(2 * count, self.tournament_size, self.selection)
+
+        if parents is not None:
+            # Crossover & Mutation of every pair
+            children_c, children_d = self.ea.crossover_batch(parents[:count], parents[count:],
+                                                             operator=self.crossover_operator)
+            children = self.ea.mutation_batch(np.concatenate([children_c, children_d]), self.mutation_operator)
+            fitness = self.ea.evaluate_batch(children)
+
+            # Memetic stage: local search on the new solutions
+            if self.memetic:
+                self.ea.improve_batch(children, fitness)
+
+            # Replacement
+            self.ea.merge(children, fitness, operator=self.replacement_operator)
+
+        self.record(i + count - 1)
+
+    def record(self, last_generation):
+        # Record the best solution when it improves (O(1) check on the segment tree)
+        # and the execution time up to the last generation of the step
+        if self.ea.population.best_fitness() < self.recorder.best.fitness:
+            self.recorder.improvement(last_generation, self.ea.best_solution())
+        self.recorder.record(last_generation)
+
+    def report_row(self, execution_time):
+        # Row of the summary report (see utils.generate_summary_report)
+        best_solution = self.recorder.best
+        return [self.report_no,
+                self.population_size,
+                self.tournament_size,
+                self.replacement_operator,
+                self.mutation_operator,
+                self.crossover_operator,
+                execution_time,
+                str(best_solution.route),
+                best_solution.fitness,
+                self.recorder.best_generation]
+
+# Map loaded once per worker process (see init_worker)
+worker_map = None
+
+def init_worker(loaded_map, lazy=False):
+    # Share the parsed map with every experimentation run by this process
+    # loaded_map: (country, map_matrix) or the dataset file (memory-mapped from the cache)
+    global worker_map
+    worker_map = load_map(loaded_map, lazy=lazy) if isinstance(loaded_map, str) else loaded_map
+
+def run_experimentation(report_no, seed, dataset, exploit=False, **options):
+    # Execute one experimentation (in a worker process or not)
+    # seed: seed of its generator (int or SeedSequence), options: keyword arguments of Experimentation
+    # Return its description, its report row and its render record (None if it is not recorded)
+    start_time = time()
+    exp = Experimentation(dataset, exploit, loaded_map=worker_map, report_no=report_no,
+                          rng=np.random.default_rng(seed), **options)
+    exp.run()
+    description = str(exp)
+    # If EA can't find the best solution while running exploit the fittest -> not record the solution
+    if exp.recorder.best_generation == 0 and exploit:
+        return description, None, None
+    # Record data of current experimentation
+    # (the image is drawn later by the render stage, see render.py)
+    return description, exp.report_row(time() - start_time), exp.render_record()
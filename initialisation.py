@@ -0,0 +1,137 @@
+import numpy as np
+# Components & Constants
+from tsp import random_routes, default_rng, RemainingVertices
+from constants import RANDOM_INITIALISATION, \
+                      NEAREST_NEIGHBOUR_INITIALISATION, \
+                      GREEDY_INITIALISATION, \
+                      SPACE_FILLING_INITIALISATION, \
+                      SEEDED_RATE
+
+# Initial routes of the population
+# - random: uniform random permutations (one batched shuffle)
+# - nearest neighbour / greedy edge: built from the sorted neighbour lists (see tsp.neighbour_lists)
+# - space-filling curve: vertices sorted by their position on a Hilbert curve (needs coordinates)
+# Constructive routes only seed a part of the population, the rest stays random for diversity
+
+def nearest_neighbour_route(map_matrix, neighbours, start):
+    # From the current vertex go to the nearest unvisited vertex
+    # (from the neighbour list, else the nearest of the remaining vertices)
+    vertex_count = len(map_matrix)
+    visited = [False] * vertex_count
+    vertex = start
+    visited[vertex] = True
+    route = [vertex]
+    remaining = RemainingVertices(route, vertex_count)
+    for _ in range(vertex_count - 1):
+        for candidate in neighbours[vertex]:
+            if not visited[candidate]:
+                vertex = candidate
+                break
+        else:
+            vertex = remaining.nearest(map_matrix, vertex)
+        visited[vertex] = True
+        route.append(vertex)
+    return route
+
+def greedy_route(map_matrix, neighbours):
+    # Greedy edge: add the cheapest candidate edges (i, j) of the neighbour lists
+    # while both vertices have less than 2 edges and (i, j) doesn't close a cycle.
+    # The fragments are then joined from end to nearest free end
+    vertex_count = len(map_matrix)
+    neighbours = np.asarray(neighbours)
+    if vertex_count < 3 or neighbours.size == 0:
+        return list(range(vertex_count))
+    rows = np.repeat(np.arange(vertex_count), neighbours.shape[1])
+    columns = neighbours.ravel()
+    edges = np.unique(np.stack([np.minimum(rows, columns), np.maximum(rows, columns)], axis=1), axis=0)
+    costs = np.asarray(map_matrix[edges[:, 0], edges[:, 1]])
+    edges = edges[np.argsort(costs, kind='stable')].tolist()
+
+    degree = [0] * vertex_count
+    adjacency = [[] for _ in range(vertex_count)]
+    fragment = list(range(vertex_count)) # Union-find of the fragments
+
+    def find(vertex):
+        while fragment[vertex] != vertex:
+            fragment[vertex] = fragment[fragment[vertex]]
+            vertex = fragment[vertex]
+        return vertex
+
+    for i, j in edges:
+        if degree[i] < 2 and degree[j] < 2:
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                fragment[root_i] = root_j
+                adjacency[i].append(j)
+                adjacency[j].append(i)
+                degree[i] += 1
+                degree[j] += 1
+
+    # Walk every fragment from one end to the other, then jump to the nearest free end
+    ends = [vertex for vertex in range(vertex_count) if degree[vertex] < 2]
+    visited = [False] * vertex_count
+    route = []
+    vertex = ends[0]
+    while True:
+        visited[vertex] = True
+        route.append(vertex)
+        following = [next_vertex for next_vertex in adjacency[vertex] if not visited[next_vertex]]
+        if following:
+            vertex = following[0]
+            continue
+        if len(route) == vertex_count:
+            return route
+        free_ends = np.array([end for end in ends if not visited[end]])
+        vertex = int(free_ends[np.argmin(map_matrix[vertex][free_ends])]) # Row read (row cache of a lazy distance)
+
+def hilbert_index(x, y, order=16):
+    # Position of the integer points (x, y) on a Hilbert curve covering (2^order x 2^order) cells
+    side = 1 << order
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.int64)
+    index = np.zeros(x.shape, dtype=np.int64)
+    s = side >> 1
+    while s > 0:
+        rx = ((x & s) > 0).astype(np.int64)
+        ry = ((y & s) > 0).astype(np.int64)
+        index += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant
+        flip = (ry == 0) & (rx == 1)
+        x = np.where(flip, side - 1 - x, x)
+        y = np.where(flip, side - 1 - y, y)
+        swap = ry == 0
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return index
+
+def space_filling_route(map_matrix, order=16):
+    # Visit the vertices in the order of a Hilbert curve through their coordinates
+    points = getattr(map_matrix, 'points', None)
+    if points is None:
+        raise ValueError('Space-filling curve initialisation needs the coordinates of the vertices')
+    low = points.min(axis=0)
+    scale = (points.max(axis=0) - low).max()
+    cells = np.zeros(points.shape) if scale == 0 else (points - low) / scale * ((1 << order) - 1)
+    return np.argsort(hilbert_index(cells[:, 0], cells[:, 1], order), kind='stable').tolist()
+
+def initial_routes(method, count, map_matrix, neighbours, rng=None):
+    # count routes (one per row): random permutations, part of them replaced by constructive routes
+    rng = default_rng(rng)
+    vertex_count = len(map_matrix)
+    routes = random_routes(count, vertex_count, rng)
+    if method == RANDOM_INITIALISATION or count == 0:
+        return routes
+    if method == NEAREST_NEIGHBOUR_INITIALISATION:
+        # Different routes from different starting vertices
+        seeded = max(1, round(count * SEEDED_RATE))
+        starts = rng.choice(vertex_count, seeded, replace=seeded > vertex_count)
+        for i, start in enumerate(starts.tolist()):
+            routes[i] = nearest_neighbour_route(map_matrix, neighbours, start)
+    # Deterministic heuristics: a single route
+    elif method == GREEDY_INITIALISATION:
+        routes[0] = greedy_route(map_matrix, neighbours)
+    elif method == SPACE_FILLING_INITIALISATION:
+        routes[0] = space_filling_route(map_matrix)
+    else:
+        raise ValueError(f'Unknown initialisation: {method}')
+    return routes
@@ -0,0 +1,112 @@
+import queue
+import multiprocessing
+import numpy as np
+from time import time
+# Components & Constants
+from tsp import TSP
+from experimentation import Experimentation
+from sweep import random_configurations
+from constants import RING, \
+                      FULLY_CONNECTED, \
+                      MIGRATION_INTERVAL, \
+                      MIGRATION_SIZE, \
+                      ISLAND_POLL_INTERVAL
+
+def island_neighbours(index, island_count, topology=RING):
+    # Islands receiving the migrants of island `index`
+    if topology == RING:
+        return [(index + 1) % island_count] if island_count > 1 else []
+    elif topology == FULLY_CONNECTED:
+        return [i for i in range(island_count) if i != index]
+    raise ValueError(f'Unknown topology: {topology}')
+
+def run_island(index, dataset, exploit, loaded_map, report_no, seed,
+               inbox, outboxes, results, migration_interval, migration_size, options):
+    # Process of one island: a whole experimentation that sends its best solutions
+    # to its neighbours every `migration_interval` generations and
+    # inserts the migrants it received (with its own replacement operator)
+    # options: keyword arguments of Experimentation
+    # Migrants that are never read must not block the exit of the process
+    for outbox in outboxes:
+        outbox.cancel_join_thread()
+    start_time = time()
+    exp = Experimentation(dataset, exploit, loaded_map=loaded_map, report_no=report_no,
+                          record_name=f'report_{report_no}_island_{index + 1}',
+                          rng=np.random.default_rng(seed), **options)
+    with exp.profiling():
+        i = 1
+        while not exp.terminated(i):
+            previous, i = i, exp.advance(i)
+            # Migrate when the generations of the step cross a multiple of the interval
+            if (i - 1) // migration_interval == (previous - 1) // migration_interval:
+                continue
+            # Emigration: best solutions of the island
+            migrants = exp.ea.best_solutions(migration_size)
+            routes = np.array([migrant.route for migrant in migrants])
+            fitness = [migrant.fitness for migrant in migrants]
+            for outbox in outboxes:
+                outbox.put((routes, fitness))
+            # Immigration: do not wait for the slower islands, take what already arrived
+            while True:
+                try:
+                    routes, fitness = inbox.get_nowait()
+                except queue.Empty:
+                    break
+                for route, cost in zip(routes, fitness):
+                    exp.ea.replace(TSP(exp.ea.map_matrix, route, fitness=cost), operator=exp.replacement_operator)
+    exp.recorder.finish()
+    # Send back only what the report needs (not the map / population of the island)
+    results.put((index, str(exp), exp.recorder.best.fitness, exp.recorder.best_generation,
+                 exp.report_row(time() - start_time), exp.render_record()))
+
+def run_islands(dataset, exploit, report_no, seed, loaded_map,
+                island_count, topology=RING,
+                migration_interval=MIGRATION_INTERVAL,
+                migration_size=MIGRATION_SIZE,
+                **options):
+    # Execute one experimentation as K islands (one process each)
+    # Return the description, report row and render record of the best island, like run_experimentation
+    # Independent stream of each island (seed: int or SeedSequence of the experimentation)
+    start_time = time()
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    # One configuration (population/tournament size, operators) for every island, drawn from the
+    # seed of the experimentation: the recorded row describes the populations of the whole run
+    options = dict(random_configurations(1, np.random.default_rng(seed))[0], **options)
+    seeds = seed.spawn(island_count)
+    inboxes = [multiprocessing.Queue() for _ in range(island_count)]
+    results = multiprocessing.Queue()
+    processes = []
+    for index in range(island_count):
+        outboxes = [inboxes[i] for i in island_neighbours(index, island_count, topology)]
+        process = multiprocessing.Process(
+            target=run_island,
+            args=(index, dataset, exploit, loaded_map, report_no, seeds[index],
+                  inboxes[index], outboxes, results, migration_interval, migration_size, options))
+        process.start()
+        processes.append(process)
+    # Read the results before joining (a process doesn't exit before its data is flushed)
+    # An island that died can't send its result: stop the others instead of waiting forever
+    islands = []
+    while len(islands) < island_count:
+        try:
+            islands.append(results.get(timeout=ISLAND_POLL_INTERVAL))
+        except queue.Empty:
+            failed = [index + 1 for index, process in enumerate(processes) if process.exitcode not in (None, 0)]
+            if failed:
+                for process in processes:
+                    process.terminate()
+                raise RuntimeError(f'Island(s) {failed} of experimentation {report_no} failed (see the traceback above)')
+    for process in processes:
+        process.join()
+
+    # Keep the island that found the best solution
+    index, description, _, best_generation, row, render_record = min(islands, key=lambda island: island[2])
+    description = f'- Islands: {island_count} ({topology}, {migration_size} migrants every {migration_interval} generations)\n' \
+                  f'- Best island: {index + 1}\n{description}'
+    # If EA can't find the best solution while running exploit the fittest -> not record the solution
+    if best_generation == 0 and exploit:
+        return description, None, None
+    # Execution time of the whole run (the islands run in parallel)
+    row[6] = time() - start_time
+    return description, row, render_record
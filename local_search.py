@@ -0,0 +1,126 @@
+from collections import deque
+import numpy as np
+
+# Local search (memetic stage) bounded by candidate lists and don't-look bits:
+# only the k nearest neighbours of a vertex are tried as the new neighbour,
+# a vertex is only checked again (taken back in the queue) when one of its edges changed
+# -> an improvement pass costs about O(n * k) instead of O(n^2).
+# The map is symmetric: reversing a part of the route doesn't change its cost
+
+IMPROVEMENT = 1e-9 # Minimum gain of a move
+
+def reverse(route, position, first, last):
+    # Reverse route[first..last] (positions, cyclic, inclusive) and update the positions.
+    # In a cycle it's the same as reversing the other side -> reverse the shorter one
+    n = len(route)
+    length = (last - first) % n + 1
+    if 2 * length > n:
+        first, last = (last + 1) % n, (first - 1) % n
+        length = n - length
+    for _ in range(length // 2):
+        route[first], route[last] = route[last], route[first]
+        position[route[first]] = first
+        position[route[last]] = last
+        first = (first + 1) % n
+        last = (last - 1) % n
+
+def two_opt_move(route, position, map_matrix, candidates, a):
+    # Try to replace two edges (one of them next to vertex a) with two shorter ones.
+    # Return the gain and the vertices whose edges changed (None if no improving move)
+    n = len(route)
+    for direction in (1, -1):
+        # Edge (a, b): b is the successor (1) or the predecessor (-1) of a
+        b = route[(position[a] + direction) % n]
+        cost_ab = map_matrix[a, b]
+        for c in candidates[a]:
+            cost_ac = map_matrix[a, c]
+            # Sorted candidates: the new edge (a, c) must be shorter than (a, b)
+            if cost_ac >= cost_ab:
+                break
+            d = route[(position[c] + direction) % n]
+            if c == b or d == a:
+                continue
+            gain = cost_ab + map_matrix[c, d] - cost_ac - map_matrix[b, d]
+            if gain > IMPROVEMENT:
+                # New edges (a, c) and (b, d)
+                if direction == 1:
+                    reverse(route, position, position[b], position[c])
+                else:
+                    reverse(route, position, position[c], position[b])
+                return gain, (a, b, c, d)
+    return 0, None
+
+def or_opt_move(route, position, map_matrix, candidates, a, max_segment=3):
+    # Try to move the segment of 1 to 3 vertices starting at vertex a
+    # next to one of the candidates of a (in any orientation)
+    n = len(route)
+    start = position[a]
+    for length in range(1, min(max_segment, n - 3) + 1):
+        segment = [route[(start + i) % n] for i in range(length)]
+        first, last = segment[0], segment[-1]
+        before = route[(start - 1) % n]
+        after = route[(start + length) % n]
+        removal_gain = map_matrix[before, first] + map_matrix[last, after] - map_matrix[before, after]
+        if removal_gain <= IMPROVEMENT:
+            continue
+        for c in candidates[first]:
+            if map_matrix[c, first] >= removal_gain:
+                break
+            if c in segment:
+                continue
+            c_next = route[(position[c] + 1) % n]
+            c_previous = route[(position[c] - 1) % n]
+            # c -> first ... last -> c_next
+            if c != before:
+                gain = removal_gain - (map_matrix[c, first] + map_matrix[last, c_next] - map_matrix[c, c_next])
+                if gain > IMPROVEMENT:
+                    move_segment(route, position, start, length, c, reverse_segment=False)
+                    return gain, (before, after, first, last, c, c_next)
+            # c_previous -> last ... first -> c
+            if c != after:
+                gain = removal_gain - (map_matrix[c_previous, last] + map_matrix[first, c] - map_matrix[c_previous, c])
+                if gain > IMPROVEMENT:
+                    move_segment(route, position, start, length, c, reverse_segment=True)
+                    return gain, (before, after, first, last, c, c_previous)
+    return 0, None
+
+def move_segment(route, position, start, length, c, reverse_segment):
+    # Move route[start:start + length] (cyclic) after c, or reversed before c
+    order = route[start:] + route[:start]
+    segment = order[:length]
+    rest = order[length:]
+    k = rest.index(c)
+    if reverse_segment:
+        route[:] = rest[:k] + segment[::-1] + rest[k:]
+    else:
+        route[:] = rest[:k + 1] + segment + rest[k + 1:]
+    for i, vertex in enumerate(route):
+        position[vertex] = i
+
+def local_search(route, fitness, map_matrix, candidates):
+    # Apply 2-opt and Or-opt moves until no move improves the route (local optimum)
+    # Return the improved route (list) and its fitness
+    route = np.asarray(route).tolist()
+    position = [0] * len(route)
+    for i, vertex in enumerate(route):
+        position[vertex] = i
+    if len(route) < 5:
+        return route, fitness
+    # Don't-look bits: only the vertices in the queue are checked
+    queue = deque(route)
+    active = [True] * len(route)
+    while queue:
+        a = queue.popleft()
+        active[a] = False
+        gain, changed = two_opt_move(route, position, map_matrix, candidates, a)
+        if not changed:
+            gain, changed = or_opt_move(route, position, map_matrix, candidates, a)
+        if not changed:
+            continue
+        fitness -= gain
+        # The endpoints of the changed edges have to be checked again
+        for vertex in (a,) + changed:
+            if not active[vertex]:
+                active[vertex] = True
+                queue.append(vertex)
+    return route, float(fitness)
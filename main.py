@@ -1,14 +1,27 @@
 import os
 import argparse
 import warnings
-from time import time
+import numpy as np
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 # Components & Constants
-from constants import REPORT_FOLDER, TERMINATION_CRITERION
-from experimentation import Experimentation
-from utils import generate_summary_report, \
-                  visualize_summary_graph, \
-                  visualize_operators_comparision, \
-                  visualize_population_and_tournament_size_comparision
+from constants import REPORT_FOLDER, \
+                      RING, FULLY_CONNECTED, \
+                      MIGRATION_INTERVAL, MIGRATION_SIZE, \
+                      RANDOM_INITIALISATION, NEAREST_NEIGHBOUR_INITIALISATION, \
+                      GREEDY_INITIALISATION, SPACE_FILLING_INITIALISATION, \
+                      OFFSPRING_PER_STEP, TOURNAMENT_SELECTION, RANK_SELECTION, \
+                      MAX_EVALUATIONS, TIME_LIMIT, TARGET_FITNESS, STALL_GENERATIONS, \
+                      DIVERSITY_THRESHOLD, STOP, RESTART, RECORD_STRIDE, \
+                      PROFILE_PHASES, PROFILE_CPROFILE, FITNESS_CACHE_SIZE, \
+                      GRID_SWEEP, RANDOM_SWEEP, HALVING_RATE
+from dataset import load_map
+from experimentation import init_worker, run_experimentation
+from island import run_islands
+from sweep import sweep, sweep_configurations
+from render import render_experimentation, render_summary
+from results import ResultStore
+from utils import generate_summary_report
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
@@ -18,51 +31,152 @@ if __name__ == '__main__':
         os.mkdir(REPORT_FOLDER)
     # Add options as parameters to the code
     parser = argparse.ArgumentParser(description="Evolutionary Algorithm: The Travelling Salesman Problem")
-    parser.add_argument("--data", "-d", help="Path to dataset file", default="datasets/burma14.xml")
+    parser.add_argument("--data", "-d", help="Path to dataset file (TSPLIB XML or plain text)", default="datasets/burma14.xml")
     parser.add_argument("--experimentation", "-e", help="Number of experimentation", default=1)
     parser.add_argument("--exploit", "-ex", help="Exploit EA by utilizing recorded solution", action='store_true')
+    parser.add_argument("--verify-delta", help="Check the incremental fitness of the mutations (children evaluated by the crossover: SCX) against a full evaluation", action='store_true')
+    parser.add_argument("--workers", "-w", help="Number of processes running the experimentations in parallel", default=1)
+    parser.add_argument("--seed", "-s", help="Seed of the run: every experimentation draws from its own stream spawned from it (random if not given)", type=int, default=None)
+    parser.add_argument("--islands", "-i", help="Run each experimentation as K islands (processes) exchanging their best solutions", type=int, default=1)
+    parser.add_argument("--topology", help="Migration topology of the islands", choices=[RING, FULLY_CONNECTED], default=RING)
+    parser.add_argument("--migration-interval", help="Generations between two migrations", type=int, default=MIGRATION_INTERVAL)
+    parser.add_argument("--migration-size", help="Number of best solutions sent by an island at every migration", type=int, default=MIGRATION_SIZE)
+    parser.add_argument("--rebuild-cache", help="Parse the dataset again instead of loading it from the cache", action='store_true')
+    parser.add_argument("--lazy-distances", help="Compute the costs of coordinate datasets on demand instead of storing the whole matrix", action='store_true')
+    parser.add_argument("--memetic", "-m", help="Improve the offspring with 2-opt/Or-opt local search before the replacement", action='store_true')
+    parser.add_argument("--offspring-per-step", "-b", help="Pairs of parents crossed per step (1: steady-state, B > 1: B generations evaluated and merged at once)", type=int, default=OFFSPRING_PER_STEP)
+    parser.add_argument("--selection", help="Selection of the parents: tournament (argmin of random indices) or rank-based (linear ranking)",
+                        choices=[TOURNAMENT_SELECTION, RANK_SELECTION], default=TOURNAMENT_SELECTION)
+    parser.add_argument("--init", help="Initialisation of the population (constructive heuristics seed a part of it)",
+                        choices=[RANDOM_INITIALISATION, NEAREST_NEIGHBOUR_INITIALISATION,
+                                 GREEDY_INITIALISATION, SPACE_FILLING_INITIALISATION],
+                        default=RANDOM_INITIALISATION)
+    parser.add_argument("--max-evaluations", help="Fitness evaluations of an experimentation (2 per generation)", type=int, default=MAX_EVALUATIONS)
+    parser.add_argument("--time-limit", help="Stop an experimentation after this number of seconds", type=float, default=TIME_LIMIT)
+    parser.add_argument("--target-fitness", help="Stop an experimentation as soon as its best fitness is lower or equal", type=float, default=TARGET_FITNESS)
+    parser.add_argument("--stall-generations", help="Stop an experimentation after N generations without improvement", type=int, default=STALL_GENERATIONS)
+    parser.add_argument("--diversity-threshold", help="Population converged when the mean fraction of edges not in the best route is lower (0-1)", type=float, default=DIVERSITY_THRESHOLD)
+    parser.add_argument("--on-convergence", help="Stop or restart (keep the best solution) a converged population", choices=[STOP, RESTART], default=STOP)
+    parser.add_argument("--record-stride", help="Generations between two samples of the convergence records", type=int, default=RECORD_STRIDE)
+    parser.add_argument("--stream-records", help="Write the convergence records to reports/records_<dataset>/ while running (bounded memory)", action='store_true')
+    parser.add_argument("--fitness-cache", help="Keep the fitness of the N last routes (any rotation/direction): known children are not evaluated again", type=int, default=FITNESS_CACHE_SIZE)
+    parser.add_argument("--reject-duplicates", help="Never insert a route that is already in the population", action='store_true')
+    parser.add_argument("--profile", help="Time every phase of the generations (printed with the results), cprofile: also write a pstats file of each run",
+                        nargs='?', choices=[PROFILE_PHASES, PROFILE_CPROFILE], const=PROFILE_PHASES, default=None)
+    parser.add_argument("--sweep", help="Parameters of the experimentations given by a sweep: every combination of the grid or -e random configurations",
+                        choices=[GRID_SWEEP, RANDOM_SWEEP], default=None)
+    parser.add_argument("--halving-rate", help="Sweep with successive halving: keep the best 1/rate configurations of every partial run, rate times more evaluations for the next one (1: no early stop)", type=int, default=HALVING_RATE)
+    parser.add_argument("--no-plots", help="Do not draw any image (summary CSV only)", action='store_true')
+    parser.add_argument("--render-workers", help="Processes drawing the images while the search goes on", type=int, default=1)
     args = parser.parse_args()
 
+    # Load the dataset once (parsed and cached on the first run),
+    # every experimentation shares it, worker processes memory-map the cache
+    loaded_map = load_map(args.data, rebuild_cache=args.rebuild_cache, lazy=args.lazy_distances)
+    if args.init == SPACE_FILLING_INITIALISATION and not hasattr(loaded_map[1], 'points'):
+        parser.error('--init space-filling needs the coordinates of the vertices (coordinate dataset with --lazy-distances)')
+    if args.migration_interval < 1:
+        parser.error('--migration-interval must be at least 1 generation')
+    if args.migration_size < 0:
+        parser.error('--migration-size must be positive or 0')
+    if args.sweep and args.islands > 1:
+        parser.error('--sweep runs one experimentation per configuration, it cannot be combined with --islands')
+    report_name = loaded_map[0]
+    report_dir = f'{REPORT_FOLDER}/report_{report_name}'
+    os.makedirs(report_dir, exist_ok=True)
+    # Results store (the summary CSV of previous versions is imported once)
+    summary_file = f'{REPORT_FOLDER}/report_{report_name}.csv'
+    store = ResultStore()
+    store.import_csv(report_name, summary_file)
+    # Number of the report (image) of each experimentation
+    # (runs without images are only in the results store)
+    first_report_no = max(len(os.listdir(report_dir)), store.last_report_no(report_name)) + 1
+    # Independent random stream for each experimentation (children of the seed of the run)
+    experimentation_count = int(args.experimentation)
+    seed_sequence = np.random.SeedSequence(args.seed)
+    if args.seed is None:
+        print(f'Seed: {seed_sequence.entropy} (--seed to reproduce the run)')
+    # Sweep: one experimentation per configuration
+    configurations = None
+    if args.sweep:
+        configurations = sweep_configurations(args.sweep, experimentation_count, np.random.default_rng(seed_sequence))
+        experimentation_count = len(configurations)
+    seeds = seed_sequence.spawn(experimentation_count)
+    report_nos = [first_report_no + i for i in range(experimentation_count)]
+    # Options shared by all the experimentations
+    options = dict(dataset=args.data,
+                   exploit=args.exploit,
+                   verify_delta=args.verify_delta,
+                   max_evaluations=args.max_evaluations,
+                   time_limit=args.time_limit,
+                   target_fitness=args.target_fitness,
+                   stall_generations=args.stall_generations,
+                   diversity_threshold=args.diversity_threshold,
+                   on_convergence=args.on_convergence,
+                   record_stride=args.record_stride,
+                   stream_records=args.stream_records,
+                   memetic=args.memetic,
+                   init=args.init,
+                   offspring_per_step=args.offspring_per_step,
+                   selection=args.selection,
+                   profile=args.profile,
+                   fitness_cache=args.fitness_cache,
+                   reject_duplicates=args.reject_duplicates)
+
     report = []
-    report_name = None
+    # Render stage: the images are drawn by background processes while the search goes on
+    renderer = None if args.no_plots else ProcessPoolExecutor(max_workers=args.render_workers)
+    renders = []
     # Run N experimentation (Finding the best route)
-    for i in range(int(args.experimentation)):
-        start_time = time()
-        # Initial random population of solutions
-        exp = Experimentation(args.data, args.exploit)
+    if configurations:
+        if int(args.workers) > 1:
+            executor = ProcessPoolExecutor(max_workers=int(args.workers), initializer=init_worker, initargs=(args.data, args.lazy_distances))
+            map_function = executor.map
+        else:
+            executor = None
+            init_worker(loaded_map)
+            map_function = map
+        results = sweep(configurations, report_nos, seeds, options, map_function, args.halving_rate)
+    elif args.islands > 1:
+        # Islands already use one process each -> experimentations run one after another
+        executor = None
+        results = (run_islands(report_no=report_no, seed=seed, loaded_map=loaded_map,
+                               island_count=args.islands, topology=args.topology,
+                               migration_interval=args.migration_interval,
+                               migration_size=args.migration_size, **options)
+                   for report_no, seed in zip(report_nos, seeds))
+    elif int(args.workers) > 1:
+        executor = ProcessPoolExecutor(max_workers=int(args.workers), initializer=init_worker, initargs=(args.data, args.lazy_distances))
+        results = executor.map(partial(run_experimentation, **options), report_nos, seeds)
+    else:
+        executor = None
+        init_worker(loaded_map)
+        results = map(partial(run_experimentation, **options), report_nos, seeds)
+    # Gather the results in order
+    for i, (description, exp_data, render_record) in enumerate(results):
         print(f'\nExperimentation {i + 1}')
-        print(exp)
-        # Execute EA
-        exp.run()
-        last_record = exp.record_best_solution[-1]
-        # If EA can't find the best solution while running exploit the fittest -> not record the solution
-        if last_record['generation'] == 0 and args.exploit:
+        print(description)
+        if exp_data is None:
             continue
-        # Generate image visualize best optimized route and Top 10 best fitness of the population
-        exp.visualise()
-        # Record data of current experimentation
-        no = round(len(os.listdir(exp.report_dir)))
-        exp_data = [no, 
-                    exp.population_size,
-                    exp.tournament_size,
-                    exp.replacement_operator,
-                    exp.mutation_operator,
-                    exp.crossover_operator ,
-                    time() - start_time,
-                    str(last_record["solution"].route),
-                    last_record["solution"].fitness,
-                    last_record['generation']]
-        print('--> Best solution:', last_record["solution"].fitness)
-        print('--> Route:', last_record["solution"].route)
-        print('--> Get the best fitness at generation:', f"{last_record['generation']} of {TERMINATION_CRITERION}")
+        if renderer:
+            renders.append(renderer.submit(render_experimentation, render_record))
+        print('--> Best solution:', exp_data[-2])
+        print('--> Route:', exp_data[-3])
+        # Generations actually run (evaluation budget, time limit or early stop)
+        print('--> Get the best fitness at generation:', f"{exp_data[-1]} of {render_record['last_generation']}")
+        # Saved as soon as the experimentation ends
+        store.add(report_name, [exp_data])
+        generate_summary_report(summary_file, [exp_data])
         report.append(exp_data)
-        report_name = exp.ea.country
+    if executor:
+        executor.shutdown()
 
-    if report_name:
-        generate_summary_report(f'{REPORT_FOLDER}/report_{report_name}.csv', report)
-        visualize_operators_comparision(f'{REPORT_FOLDER}/operators_comparision_{report_name}.png', report)
-        visualize_summary_graph(f'{REPORT_FOLDER}/summary_graph_{report_name}.png', report)
-        visualize_population_and_tournament_size_comparision(
-            f'{REPORT_FOLDER}/population_and_tournament_size_comparision_{report_name}.png', 
-            report
-        )
+    # Summary graphs of all the recorded experimentations
+    if report and renderer:
+        renders.append(renderer.submit(render_summary, report_name, store.rows(report_name), REPORT_FOLDER))
+    store.close()
+    # Wait for the images (and raise the errors of the render stage)
+    if renderer:
+        for render in renders:
+            render.result()
+        renderer.shutdown()
@@ -0,0 +1,178 @@
+from collections import Counter
+from collections.abc import Sequence
+from math import inf
+import numpy as np
+# Components
+from tsp import TSP
+from tour_cache import route_key, route_keys
+
+def route_dtype(vertex_count):
+    # Smallest integer type able to hold every vertex index
+    return np.int16 if vertex_count <= np.iinfo(np.int16).max else np.int32
+
+class Population(Sequence):
+    # Population of solutions stored as one (P x n) matrix of routes plus a fitness vector.
+    # The fitness is indexed by two segment trees (min & max fitness)
+    # - best solution: O(1) value, O(log P) index
+    # - weakest solution / first solution weaker than X: O(log P)
+    # - replacing a solution: O(n) copy of the route + O(log P)
+    # It is still a Sequence of TSP (views on the rows), so random.sample works for the tournaments
+    def __init__(self, map_matrix, capacity=1):
+        self.map_matrix = map_matrix
+        self.vertex_count = len(map_matrix)
+        self.size = 0
+        self.capacity = 1 # Number of rows / leaves in the trees (power of 2)
+        while self.capacity < capacity:
+            self.capacity *= 2
+        self.routes = np.empty((self.capacity, self.vertex_count), dtype=route_dtype(self.vertex_count))
+        self.fitness = np.full(self.capacity, inf)
+        self.route_counts = None # Canonical routes of the solutions (see track_routes)
+        self.version = 0 # Incremented by every write (caches on the solutions, see EA.rank_indices)
+        self._build()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.size))]
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError('population index out of range')
+        # View on the row: the route changes if the solution is replaced
+        return TSP(self.map_matrix, self.routes[index], fitness=float(self.fitness[index]))
+
+    def __setitem__(self, index, solution):
+        self.routes[index] = solution.route
+        self.fitness[index] = solution.fitness
+        self.version += 1
+        self._update(index)
+        if self.route_counts is not None:
+            self._count(index, route_key(self.routes[index]))
+
+    def track_routes(self):
+        # Count the canonical routes of the solutions (see tour_cache),
+        # kept up to date by every write -> contains() without scanning the population
+        self.row_keys = route_keys(self.routes[:self.size])
+        self.route_counts = Counter(self.row_keys)
+
+    def contains(self, key):
+        # Is the canonical route (key) already in the population? (see track_routes)
+        return self.route_counts[key] > 0
+
+    def _track(self, indices):
+        if self.route_counts is None:
+            return
+        indices = np.asarray(indices, dtype=np.intp)
+        for index, key in zip(indices.tolist(), route_keys(self.routes[indices])):
+            self._count(index, key)
+
+    def _count(self, index, key):
+        # The solution at index is now the route with this key
+        if index < len(self.row_keys):
+            previous = self.row_keys[index]
+            self.route_counts[previous] -= 1
+            if not self.route_counts[previous]:
+                del self.route_counts[previous]
+            self.row_keys[index] = key
+        else:
+            self.row_keys.append(key)
+        self.route_counts[key] += 1
+
+    def reserve(self, capacity):
+        # Grow the matrix (and the trees) to hold at least `capacity` solutions
+        if capacity <= self.capacity:
+            return
+        while self.capacity < capacity:
+            self.capacity *= 2
+        routes = np.empty((self.capacity, self.vertex_count), dtype=self.routes.dtype)
+        routes[:self.size] = self.routes[:self.size]
+        fitness = np.full(self.capacity, inf)
+        fitness[:self.size] = self.fitness[:self.size]
+        self.routes, self.fitness = routes, fitness
+        self._build()
+
+    def append(self, solution):
+        self.extend([solution.route], [solution.fitness])
+
+    def extend(self, routes, fitness):
+        # Copy a batch of (already evaluated) routes at the end of the population
+        count = len(routes)
+        if self.size + count > self.capacity:
+            self.reserve(self.size + count)
+        self.routes[self.size:self.size + count] = routes
+        self.fitness[self.size:self.size + count] = fitness
+        self.size += count
+        self.version += 1
+        self._refresh(range(self.size - count, self.size))
+        self._track(range(self.size - count, self.size))
+
+    def assign(self, indices, routes, fitness):
+        # Replace a batch of solutions at once (one route per index)
+        self.routes[indices] = routes
+        self.fitness[indices] = fitness
+        self.version += 1
+        self._refresh(indices)
+        self._track(indices)
+
+    def _refresh(self, indices):
+        # Few changed leaves: update their paths, many: rebuild the whole trees
+        if len(indices) * self.capacity.bit_length() < self.capacity:
+            for index in indices:
+                self._update(int(index))
+        else:
+            self._build()
+
+    def _build(self):
+        fitness = self.fitness.tolist()
+        self.min_tree = [inf] * self.capacity + fitness
+        self.max_tree = [-inf] * self.capacity + fitness[:self.size] + [-inf] * (self.capacity - self.size)
+        for node in range(self.capacity - 1, 0, -1):
+            self.min_tree[node] = min(self.min_tree[2 * node], self.min_tree[2 * node + 1])
+            self.max_tree[node] = max(self.max_tree[2 * node], self.max_tree[2 * node + 1])
+
+    def _update(self, index):
+        # Update the leaf then every ancestor up to the root
+        node = self.capacity + index
+        self.min_tree[node] = self.max_tree[node] = float(self.fitness[index])
+        node //= 2
+        while node:
+            self.min_tree[node] = min(self.min_tree[2 * node], self.min_tree[2 * node + 1])
+            self.max_tree[node] = max(self.max_tree[2 * node], self.max_tree[2 * node + 1])
+            node //= 2
+
+    def best_index(self):
+        # First solution with the lowest fitness
+        if not self.size:
+            return None
+        node = 1
+        while node < self.capacity:
+            node = 2 * node if self.min_tree[2 * node] == self.min_tree[node] else 2 * node + 1
+        return node - self.capacity
+
+    def weakest_index(self):
+        # First solution with the highest fitness
+        if not self.size:
+            return None
+        node = 1
+        while node < self.capacity:
+            node = 2 * node if self.max_tree[2 * node] == self.max_tree[node] else 2 * node + 1
+        return node - self.capacity
+
+    def first_weaker_index(self, fitness):
+        # First solution (in population order) with a higher fitness than the given one
+        if not self.size or self.max_tree[1] <= fitness:
+            return None
+        node = 1
+        while node < self.capacity:
+            node = 2 * node if self.max_tree[2 * node] > fitness else 2 * node + 1
+        return node - self.capacity
+
+    def best_fitness(self):
+        # O(1): root of the min tree (inf if the population is empty)
+        return self.min_tree[1]
+
+    def best(self):
+        index = self.best_index()
+        return None if index is None else self[index]
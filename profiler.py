@@ -0,0 +1,52 @@
+from time import perf_counter_ns
+
+class PhaseTimer:
+    # Cumulative time (perf_counter_ns) and number of calls of each phase of the generations.
+    # The phases are timed by wrappers installed on the callables of the phases (attributes of
+    # the EA / experimentation) while profiling only: no timing code runs when it is off.
+    # A call made inside another timed phase is counted in the outer phase only
+    def __init__(self):
+        self.times = {}
+        self.calls = {}
+        self.total = 0 # Time of the profiled runs
+        self.wrapped = [] # (owner, attribute, own attribute before wrapping)
+        self.active = False
+
+    def wrap(self, owner, attribute, phase):
+        function = getattr(owner, attribute)
+        self.times.setdefault(phase, 0)
+        self.calls.setdefault(phase, 0)
+        def timed(*args, **kwargs):
+            if self.active:
+                return function(*args, **kwargs)
+            self.active = True
+            start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.times[phase] += perf_counter_ns() - start
+                self.calls[phase] += 1
+                self.active = False
+        self.wrapped.append((owner, attribute, vars(owner).get(attribute)))
+        setattr(owner, attribute, timed)
+
+    def unwrap(self):
+        # Restore the callables (the wrappers can't be pickled, e.g. results of the islands)
+        for owner, attribute, previous in reversed(self.wrapped):
+            if previous is None:
+                delattr(owner, attribute)
+            else:
+                setattr(owner, attribute, previous)
+        self.wrapped = []
+
+    def table(self):
+        # Breakdown of the profiled time: one line per phase (+ the rest of the loop)
+        total = max(self.total, 1)
+        lines = [f"  {'Phase':<14}{'Calls':>10}{'Total (ms)':>13}{'Per call (us)':>15}{'Share':>8}"]
+        for phase, elapsed in self.times.items():
+            calls = self.calls[phase]
+            if calls:
+                lines.append(f'  {phase:<14}{calls:>10}{elapsed / 1e6:>13.1f}{elapsed / calls / 1e3:>15.2f}{elapsed / total:>8.1%}')
+        other = self.total - sum(self.times.values())
+        lines.append(f"  {'other':<14}{'':>10}{other / 1e6:>13.1f}{'':>15}{other / total:>8.1%}")
+        return '\n'.join(lines)
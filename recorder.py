@@ -0,0 +1,99 @@
+import os
+import numpy as np
+from time import perf_counter
+# Constants
+from constants import RECORD_STRIDE, RECORD_BLOCK
+
+class Recorder:
+    # Convergence of an experimentation:
+    # - one sample (generation, best fitness, elapsed time) every `stride` generations,
+    #   kept in preallocated NumPy arrays
+    # - the best route only when the best fitness improves
+    # With a folder (streaming), full blocks of samples and every improvement are appended
+    # to binary files -> the memory used by a long run is bounded
+    def __init__(self, solution, vertex_count, stride=RECORD_STRIDE, block=RECORD_BLOCK, folder=None, name='record'):
+        self.stride = max(1, stride)
+        self.sample_dtype = np.dtype([('generation', np.int64), ('fitness', np.float64), ('elapsed', np.float64)])
+        self.improvement_dtype = np.dtype([('generation', np.int64), ('fitness', np.float64),
+                                           ('route', np.int32, (vertex_count,))])
+        self.samples = np.empty(block, dtype=self.sample_dtype)
+        self.sample_count = 0 # Samples in memory
+        self.improvements = [] # (generation, TSP) in memory, not streamed yet
+        self.sample_file = self.improvement_file = None
+        if folder is not None:
+            os.makedirs(folder, exist_ok=True)
+            self.sample_file = f'{folder}/{name}_convergence.bin'
+            self.improvement_file = f'{folder}/{name}_improvements.bin'
+            for file in (self.sample_file, self.improvement_file):
+                open(file, 'wb').close()
+        self.generation = 0 # Last recorded generation
+        self.execution_time = 0.0
+        self.clock = perf_counter()
+        self.best = None
+        self.best_generation = 0
+        self.improvement(0, solution)
+        self.sample()
+
+    def improvement(self, generation, solution):
+        # New best solution (population rows are overwritten -> keep a copy)
+        self.best = solution.copy()
+        self.best_generation = generation
+        self.improvements.append((generation, self.best))
+        if self.improvement_file:
+            self.flush_improvements()
+
+    def record(self, generation):
+        # End of the generations up to `generation`: one clock reading per step
+        clock = perf_counter()
+        self.execution_time += clock - self.clock
+        self.clock = clock
+        previous, self.generation = self.generation, generation
+        if generation // self.stride > previous // self.stride:
+            self.sample()
+
+    def sample(self):
+        if self.sample_count == len(self.samples):
+            if self.sample_file:
+                self.flush_samples()
+            else:
+                self.samples = np.resize(self.samples, 2 * len(self.samples))
+        self.samples[self.sample_count] = (self.generation, self.best.fitness, self.execution_time)
+        self.sample_count += 1
+        self.sampled_generation = self.generation
+
+    def finish(self):
+        # Sample the last generation & write what is left in memory
+        if self.sampled_generation != self.generation:
+            self.sample()
+        if self.sample_file:
+            self.flush_samples()
+
+    def flush_samples(self):
+        with open(self.sample_file, 'ab') as file:
+            self.samples[:self.sample_count].tofile(file)
+        self.sample_count = 0
+
+    def flush_improvements(self):
+        records = np.empty(len(self.improvements), dtype=self.improvement_dtype)
+        for record, (generation, solution) in zip(records, self.improvements):
+            record['generation'] = generation
+            record['fitness'] = solution.fitness
+            record['route'] = solution.route
+        with open(self.improvement_file, 'ab') as file:
+            records.tofile(file)
+        self.improvements = []
+
+    def convergence(self):
+        # Samples (generation, fitness, elapsed) of the whole run
+        samples = self.samples[:self.sample_count]
+        if self.sample_file:
+            samples = np.concatenate([np.fromfile(self.sample_file, dtype=self.sample_dtype), samples])
+        return samples
+
+    def improvement_history(self):
+        # (generation, fitness) of every improvement of the best fitness
+        if self.improvement_file:
+            records = np.fromfile(self.improvement_file, dtype=self.improvement_dtype)
+            return records['generation'], records['fitness']
+        return np.array([generation for generation, _ in self.improvements]), \
+               np.array([solution.fitness for _, solution in self.improvements])
@@ -0,0 +1,106 @@
+import numpy as np
+# Constants
+from constants import BRAZIL
+
+# Render stage: draws the images from the compact records of the experimentations
+# (see Experimentation.render_record), out of the search processes.
+# matplotlib & seaborn are only imported when an image is drawn
+
+def render_experimentation(record):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from matplotlib.collections import LineCollection
+    # Only visualize the best solution
+    route = record['route']
+    fitness = record['fitness']
+    best_generation = record['best_generation']
+    points = record['points']
+    # Create 2x2 plot
+    fig, ax = plt.subplots(2, 2, figsize=(12, 8))
+    fig.suptitle(f"TSP - Experimentation {record['report_name']}", wrap=True)
+
+    # Visualise route of best solution
+    colors = sns.color_palette("husl", len(points))
+    # Add route between cities: all the edges (lines) in a single collection,
+    # the closing edge (last -> first vertex) has the color of the last vertex
+    tour = points[np.append(route, route[0])]
+    edges = np.stack([tour[:-1], tour[1:]], axis=1)
+    ax[0,0].add_collection(LineCollection(edges, colors=colors, linewidths=2))
+    # Create a scatter plot with sample data points (visualising the map/cities)
+    ax[0,0].scatter(points[:, 0], points[:, 1], c=colors, s=225, edgecolors='black', zorder=2)
+    for i, (x, y) in enumerate(points.tolist()):
+        ax[0,0].annotate(i, (x, y), textcoords="offset points", xytext=(0, -3), ha='center')
+    ax[0,0].autoscale_view()
+    # Add label, title and annotates
+    ax[0,0].set_title(f'Route of best solution {fitness}')
+    ax[0,0].set_xlabel(f"Population Size of {record['population_size']}")
+    ax[0,0].set_ylabel(f"Tournament Size of {record['tournament_size']}")
+
+    # convergence curves
+    # (best fitness only changes at the improvements -> step curve up to the last generation)
+    generations, list_best_fitness = record['improvements']
+    ax[0,1].step(np.append(generations, record['last_generation']),
+                 np.append(list_best_fitness, fitness),
+                 where='post',
+                 color='#3274A1')
+    ax[0,1].scatter([best_generation], [fitness], color='#E1812C', zorder=2)
+    ax[0,1].annotate(
+        fitness,
+        (best_generation, fitness),
+        textcoords="offset points",
+        xytext=(10, 5),
+        ha='center',
+        color='#E1812C')
+    y_offset = 5000 if record['country'] == BRAZIL else 500
+    # Add a vertical line (from the x-axis to the point)
+    ax[0,1].vlines(x=best_generation, color='#919AA1', linestyle='--', ymin=fitness - y_offset, ymax=fitness)
+    # Add a horizontal line (from the y-axis to the point)
+    ax[0,1].hlines(y=fitness, color='#919AA1', linestyle='--', xmin=0 ,xmax=best_generation)
+    # Add label, title
+    ax[0,1].set_xlabel(f'Generations')
+    ax[0,1].set_ylabel(f'Fitness of the best solution')
+    ax[0,1].set_title('Convergence curves')
+
+    # Visualise execution time
+    generations, elapsed = record['samples']
+    ax[1,0].plot(generations, elapsed, color='#cc241d')
+    ax[1,0].set_xlabel('Generations')
+    ax[1,0].set_ylabel('Duration (s)')
+    ax[1,0].set_title(f"Execution Time {record['execution_time']}s")
+
+    # More annotation
+    ax[1,1].set_title('Parameters')
+    txt = ax[1,1].text(.5,.5,
+                   str(route.tolist())[1:-1].replace(",", " >"),
+                   ha='center',
+                   wrap=True)
+    txt._get_wrap_line_width = lambda : 400.
+    ax[1,1].annotate(f"Crossover operator: {record['crossover_operator']}",
+                   xy=(0.5, 0.4),
+                   xycoords='axes fraction',
+                   ha='center')
+    ax[1,1].annotate(f"Replacement operator: {record['replacement_operator']}",
+                   xy=(0.5, 0.3),
+                   xycoords='axes fraction',
+                   ha='center')
+    ax[1,1].annotate(f"Mutation operator: {record['mutation_operator']}",
+                   xy=(0.5, 0.2),
+                   xycoords='axes fraction',
+                   ha='center')
+
+    # Save plot
+    plt.tight_layout()
+    plt.savefig(record['file'])
+    plt.close()
+
+def render_summary(report_name, report, report_folder):
+    # Summary graphs of all the experimentations (report rows)
+    from utils import visualize_operators_comparision, \
+                      visualize_summary_graph, \
+                      visualize_population_and_tournament_size_comparision
+    visualize_operators_comparision(f'{report_folder}/operators_comparision_{report_name}.png', report)
+    visualize_summary_graph(f'{report_folder}/summary_graph_{report_name}.png', report)
+    visualize_population_and_tournament_size_comparision(
+        f'{report_folder}/population_and_tournament_size_comparision_{report_name}.png',
+        report
+    )
@@ -0,0 +1,89 @@
+import csv
+import os
+import sqlite3
+import numpy as np
+# Constants
+from constants import REPORT_FOLDER, RESULTS_DATABASE
+
+# Append-only store of the experimentation results (SQLite):
+# - one row per experimentation, inserted once, never rewritten
+# - index on (dataset, best fitness, generation): sorted report & top-K routes without a full scan
+# - WAL journal + busy timeout: parallel runs (processes) can write at the same time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    dataset TEXT NOT NULL,
+    report_no INTEGER NOT NULL,
+    population_size INTEGER,
+    tournament_size INTEGER,
+    replacement_operator TEXT,
+    mutation_operator TEXT,
+    crossover_operator TEXT,
+    execution_time REAL,
+    route BLOB NOT NULL,
+    fitness REAL NOT NULL,
+    generation INTEGER
+);
+CREATE INDEX IF NOT EXISTS results_fitness ON results (dataset, fitness, generation);
+CREATE INDEX IF NOT EXISTS results_report_no ON results (dataset, report_no);
+'''
+COLUMNS = 'report_no, population_size, tournament_size, replacement_operator, mutation_operator, ' \
+          'crossover_operator, execution_time, route, fitness, generation'
+
+def encode_route(route):
+    # Route as a list/array or as written in the CSV report: "[0, 1, ...]"
+    if isinstance(route, str):
+        route = [int(vertex) for vertex in route[1:-1].split(',')]
+    return np.asarray(route, dtype=np.int32).tobytes()
+
+def decode_route(blob):
+    return np.frombuffer(blob, dtype=np.int32)
+
+class ResultStore:
+    def __init__(self, file=f'{REPORT_FOLDER}/{RESULTS_DATABASE}', timeout=60):
+        os.makedirs(os.path.dirname(file) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(file, timeout=timeout)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, dataset, report):
+        # Append report rows (see Experimentation.report_row) in one transaction
+        with self.connection:
+            self.connection.executemany(
+                f'INSERT INTO results (dataset, {COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(dataset, int(row[0]), int(row[1]), int(row[2]), row[3], row[4], row[5], float(row[6]),
+                  encode_route(row[7]), float(row[8]), int(float(row[9]))) for row in report])
+
+    def count(self, dataset):
+        return self.connection.execute('SELECT COUNT(*) FROM results WHERE dataset = ?', (dataset,)).fetchone()[0]
+
+    def last_report_no(self, dataset):
+        # Highest experimentation number (0 if there is none)
+        return self.connection.execute(
+            'SELECT COALESCE(MAX(report_no), 0) FROM results WHERE dataset = ?', (dataset,)).fetchone()[0]
+
+    def rows(self, dataset):
+        # Every report row of the dataset, sorted by fitness & generation that achieve best fitness
+        cursor = self.connection.execute(
+            f'SELECT {COLUMNS} FROM results WHERE dataset = ? ORDER BY fitness, generation', (dataset,))
+        return [[*row[:7], str(decode_route(row[7]).tolist()), *row[8:]] for row in cursor]
+
+    def top_routes(self, dataset, k):
+        # Routes of the k best results (exploit), read from the fitness index
+        cursor = self.connection.execute(
+            'SELECT route FROM results WHERE dataset = ? ORDER BY fitness, generation LIMIT ?', (dataset, k))
+        return [decode_route(route) for route, in cursor]
+
+    def import_csv(self, dataset, file):
+        # Load a summary report CSV written by previous versions (only into an empty dataset)
+        if self.count(dataset) or not os.path.exists(file):
+            return 0
+        with open(file, 'r', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None) # Header
+            report = list(reader)
+        self.add(dataset, report)
+        return len(report)
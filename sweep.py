@@ -0,0 +1,100 @@
+import itertools
+from math import log
+# Components & Constants
+from experimentation import run_experimentation
+from utils import list_mutations, list_crossovers, list_replacements
+from constants import POPULATION_RANGE, TOURNAMENT_DIVIDE_RANGE, \
+                      SWEEP_POPULATION_SIZES, SWEEP_TOURNAMENT_DIVISORS, \
+                      GRID_SWEEP, RANDOM_SWEEP
+
+# Hyper-parameter sweeps: the parameters of the experimentations (population/tournament size,
+# operators) are given by a sweep instead of being drawn by every experimentation
+# - grid: every combination of SWEEP_POPULATION_SIZES x SWEEP_TOURNAMENT_DIVISORS x operators
+# - random: N configurations drawn from the same ranges as Experimentation
+# - successive halving (halving rate > 1): every configuration runs a small budget, only the best
+#   1/rate of them (best fitness of their partial run) go on with a budget rate times larger
+#   A configuration that goes on runs again from generation 0 (from its seed: the same trajectory,
+#   extended): the evaluations of its previous rungs are spent again (counted in the printed budgets),
+#   but no state (population, map) is sent between the processes
+# Only the runs with the full budget are recorded (results store, CSV, images): partial runs are
+# printed, they would bias the summaries (averages by operator) against the eliminated configurations
+
+def configuration(population_size, tournament_divisor, crossover_operator, mutation_operator, replacement_operator):
+    # Keyword arguments of Experimentation
+    return dict(population_size=population_size,
+                tournament_size=max(1, round(population_size / tournament_divisor)),
+                crossover_operator=crossover_operator,
+                mutation_operator=mutation_operator,
+                replacement_operator=replacement_operator)
+
+def grid_configurations():
+    return [configuration(*parameters) for parameters in itertools.product(
+        SWEEP_POPULATION_SIZES, SWEEP_TOURNAMENT_DIVISORS, list_crossovers, list_mutations, list_replacements)]
+
+def random_configurations(count, rng):
+    return [configuration(int(rng.integers(POPULATION_RANGE[0], POPULATION_RANGE[1] + 1)),
+                          int(rng.integers(TOURNAMENT_DIVIDE_RANGE[0], TOURNAMENT_DIVIDE_RANGE[1] + 1)),
+                          list_crossovers[rng.integers(len(list_crossovers))],
+                          list_mutations[rng.integers(len(list_mutations))],
+                          list_replacements[rng.integers(len(list_replacements))])
+            for _ in range(count)]
+
+def sweep_configurations(strategy, count, rng):
+    if strategy == GRID_SWEEP:
+        return grid_configurations()
+    elif strategy == RANDOM_SWEEP:
+        return random_configurations(count, rng)
+    raise ValueError(f'Unknown sweep: {strategy}')
+
+def run_configuration(report_no, seed, configuration, options):
+    # Experimentation of one configuration (in a worker process or not), see run_experimentation
+    return run_experimentation(report_no, seed, **options, **configuration)
+
+def rung_budgets(configuration_count, max_evaluations, rate):
+    # Evaluations of every rung: the last one has the full budget, each one before it 1/rate of the next
+    # (as many rungs as halvings needed to keep a single configuration)
+    if rate <= 1 or configuration_count <= 1:
+        return [max_evaluations]
+    rungs = int(log(configuration_count) / log(rate) + 1e-9) + 1
+    return [max(2, round(max_evaluations / rate ** (rungs - 1 - k))) for k in range(rungs)]
+
+def rank(row):
+    # Unrecorded runs (e.g. exploit without improvement) come last
+    return (float('inf'), 0) if row is None else (float(row[8]), int(row[9]))
+
+def sweep(configurations, report_nos, seeds, options, map_function=map, halving_rate=1):
+    # Run the configurations, yield (description, report row, render record) of every configuration
+    # once, from its last run (report row & render record: None for a configuration eliminated by a rung)
+    # map_function: map or the map of a process pool (one experimentation per configuration)
+    running = list(range(len(configurations)))
+    budgets = rung_budgets(len(configurations), options['max_evaluations'], halving_rate)
+    spent = 0 # Evaluations budget of every run (including the rungs run again)
+    for rung, budget in enumerate(budgets, 1):
+        spent += budget * len(running)
+        if len(budgets) > 1:
+            rerun = f', {budgets[rung - 2]} of them run again' if rung > 1 else ''
+            print(f'\nSweep rung {rung}/{len(budgets)}: {len(running)} configurations x {budget} evaluations{rerun}')
+        rung_options = dict(options, max_evaluations=budget)
+        results = list(map_function(run_configuration,
+                                    [report_nos[k] for k in running],
+                                    [seeds[k] for k in running],
+                                    [configurations[k] for k in running],
+                                    itertools.repeat(rung_options)))
+        last_rung = rung == len(budgets)
+        # Best (fitness, generation of the best fitness) of the partial runs go on
+        order = sorted(range(len(running)), key=lambda k: rank(results[k][1]))
+        kept = len(running) if last_rung else max(1, int(len(running) / halving_rate))
+        for position, k in enumerate(order):
+            if position < kept and not last_rung:
+                continue
+            description, row, render_record = results[k]
+            if last_rung:
+                yield f'- Sweep: full budget ({budget} evaluations)\n{description}', row, render_record
+            else:
+                # Partial run: printed only (see above)
+                yield f'- Sweep: stopped at rung {rung}/{len(budgets)} ({budget} evaluations, not recorded)\n' \
+                      f'{description}\n--> Best solution (partial run): {rank(row)[0]}', None, None
+        running = [running[k] for k in sorted(order[:kept])]
+    if len(budgets) > 1:
+        print(f'\nSweep: {spent} evaluations budget for {len(configurations)} configurations '
+              f'({len(configurations) * budgets[-1]} with the full budget for every configuration)')
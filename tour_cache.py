@@ -0,0 +1,71 @@
+from collections import OrderedDict
+import numpy as np
+# Components
+from tsp import batch_fitness
+
+# Canonical form of a route: the same tour written from any vertex, in either direction,
+# has a single key (the costs are symmetric, see inversion_delta)
+# -> rotated to start at vertex 0, then written in the direction of its smaller neighbour
+
+def canonical_routes(routes):
+    # Canonical form of every route (row), vectorized
+    routes = np.asarray(routes, dtype=np.int32)
+    vertex_count = routes.shape[1]
+    start = np.argmin(routes, axis=1) # Position of vertex 0
+    canonical = np.take_along_axis(routes, (start[:, None] + np.arange(vertex_count)) % vertex_count, axis=1)
+    if vertex_count > 2:
+        reverse = canonical[:, 1] > canonical[:, -1]
+        canonical[reverse, 1:] = canonical[reverse, :0:-1]
+    return canonical
+
+def route_keys(routes):
+    # Hashable key (bytes of the canonical form) of every route
+    if len(routes) <= 4:
+        # A few routes (e.g. the two children of a generation): one at a time is faster
+        return [route_key(route) for route in routes]
+    return [route.tobytes() for route in canonical_routes(routes)]
+
+def route_key(route):
+    # Key of a single route (same as route_keys, without the overhead of the 2D version)
+    route = np.asarray(route, dtype=np.int32)
+    start = int(route.argmin())
+    canonical = np.concatenate((route[start:], route[:start]))
+    if len(canonical) > 2 and canonical[1] > canonical[-1]:
+        canonical[1:] = canonical[:0:-1].copy()
+    return canonical.tobytes()
+
+class FitnessCache:
+    # Bounded LRU cache: canonical route -> fitness
+    # Children identical to a recent route (in any rotation / direction) are not evaluated again
+    # Looked up for the mutated children whose fitness is unknown: every child of a batched step,
+    # the PMX/OX children of a steady-state step (SCX children are evaluated by the crossover)
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def evaluate(self, map_matrix, routes, keys):
+        # Fitness of every route: cached ones are read, the others evaluated in one batch & cached
+        fitness = np.empty(len(keys))
+        missing = []
+        for k, key in enumerate(keys):
+            cost = self.entries.get(key)
+            if cost is None:
+                missing.append(k)
+            else:
+                self.entries.move_to_end(key)
+                fitness[k] = cost
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            fitness[missing] = batch_fitness(map_matrix, np.asarray(routes)[missing])
+            for k in missing:
+                self.entries[keys[k]] = float(fitness[k])
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False) # Least recently used
+        return fitness
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
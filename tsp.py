@@ -1,27 +1,303 @@
-import random
+import numpy as np
 from constants import PARTIALLY_MAPPED_CROSSOVER, \
                       SEQUENTIAL_CONSTRUCTIVE_CROSSOVER, \
                       ORDERED_CROSSOVER, \
                       SINGLE_SWAP_MUTATION, \
-                      INVERSION
-from utils import swap_gene
+                      INVERSION, \
+                      VERIFY_DELTA_EVALUATION, \
+                      NEIGHBOUR_LIST_SIZE
+
+# Randomness: every random function takes the generator of the run (rng: numpy.random.Generator,
+# see Experimentation), a fresh unseeded generator is used when none is given.
+# The same seed -> the same search trajectory
+
+def default_rng(rng=None):
+    return np.random.default_rng() if rng is None else rng
+
+def random_index(rng, low, high):
+    # Random integer low <= i < high for the scalar (per generation) draws:
+    # rng.random() is several times cheaper than a scalar rng.integers call
+    return low + int(rng.random() * (high - low))
+
+def random_route(vertex_count, rng=None):
+    # Uniform random permutation of the vertices (Fisher-Yates shuffle, O(n))
+    return default_rng(rng).permutation(vertex_count).tolist()
+
+def random_routes(count, vertex_count, rng=None):
+    # count random permutations at once: every row of the (count x n) matrix is shuffled in one call
+    return default_rng(rng).permuted(np.broadcast_to(np.arange(vertex_count), (count, vertex_count)), axis=1)
+
+def batch_fitness(map_matrix, routes):
+    # Score a 2D array of routes (one route per row) at once:
+    # cost of every edge (route[i] -> route[i + 1]) including the closing edge
+    routes = np.asarray(routes)
+    return map_matrix[routes, np.roll(routes, -1, axis=1)].sum(axis=1)
+
+def swap_delta(map_matrix, route, first_index, second_index):
+    # Fitness change when swapping the vertices at two positions:
+    # only the (at most 4) edges entering and leaving both positions are affected
+    n = len(route)
+    i, j = min(first_index, second_index), max(first_index, second_index)
+    if i == j or n <= 2:
+        return 0.0
+    a, b = route[i], route[j]
+    if j - i == 1:
+        # Adjacent: p -> a -> b -> q becomes p -> b -> a -> q
+        p, q = route[i - 1], route[(j + 1) % n]
+        return float(map_matrix[p, b] + map_matrix[b, a] + map_matrix[a, q]
+                     - map_matrix[p, a] - map_matrix[a, b] - map_matrix[b, q])
+    if i == 0 and j == n - 1:
+        # Adjacent through the closing edge: p -> b -> a -> q becomes p -> a -> b -> q
+        p, q = route[j - 1], route[1]
+        return float(map_matrix[p, a] + map_matrix[a, b] + map_matrix[b, q]
+                     - map_matrix[p, b] - map_matrix[b, a] - map_matrix[a, q])
+    p_a, q_a, p_b, q_b = route[i - 1], route[i + 1], route[j - 1], route[(j + 1) % n]
+    return float(map_matrix[p_a, b] + map_matrix[b, q_a] + map_matrix[p_b, a] + map_matrix[a, q_b]
+                 - map_matrix[p_a, a] - map_matrix[a, q_a] - map_matrix[p_b, b] - map_matrix[b, q_b])
+
+def inversion_delta(map_matrix, route, first_index, second_index):
+    # Fitness change when reversing route[first_index:second_index]:
+    # the map is symmetric so only the two edges at the border of the segment change
+    n = len(route)
+    before_first = route[first_index - 1]
+    after_last = route[second_index % n]
+    first = route[first_index]
+    last = route[second_index - 1]
+    return float(map_matrix[before_first, last] + map_matrix[first, after_last] \
+                 - map_matrix[before_first, first] - map_matrix[last, after_last])
+
+def inverse_permutation(route):
+    # position[vertex] = index of the vertex in the route
+    position = np.empty(len(route), dtype=np.intp)
+    position[route] = np.arange(len(route))
+    return position
+
+def partially_mapped_crossover(parent_a, parent_b, first_point, second_point, child):
+    # Copy parent A, then for every gene of parent B's segment swap it into place.
+    # The position lookup makes each swap O(1) -> O(n) per child
+    route = np.asarray(parent_a).tolist()
+    position = inverse_permutation(route).tolist()
+    for i, vertex in enumerate(np.asarray(parent_b[first_point:second_point]).tolist(), first_point):
+        j = position[vertex]
+        route[i], route[j] = vertex, route[i]
+        position[route[j]] = j
+        position[vertex] = i
+    child[:] = route
+    return child
+
+def ordered_crossover(parent_a, parent_b, first_point, second_point, child):
+    # Keep parent A's segment and fill the other positions (left to right)
+    # with the remaining genes in the order of parent B.
+    # Membership is a boolean mask indexed by vertex -> O(n) per child
+    parent_a = np.asarray(parent_a)
+    parent_b = np.asarray(parent_b)
+    in_segment = np.zeros(len(parent_a), dtype=bool)
+    in_segment[parent_a[first_point:second_point]] = True
+    remaining = parent_b[~in_segment[parent_b]]
+    child[:first_point] = remaining[:first_point]
+    child[first_point:second_point] = parent_a[first_point:second_point]
+    child[second_point:] = remaining[first_point:]
+    return child
+
+def neighbour_lists(map_matrix, k=NEIGHBOUR_LIST_SIZE, rows=256):
+    # k nearest vertices of every vertex, sorted by cost (the vertex itself excluded)
+    # Computed by blocks of rows so it works on any distance backend (see distance.py)
+    vertex_count = len(map_matrix)
+    k = min(k, vertex_count - 1)
+    if k <= 0:
+        return np.empty((vertex_count, 0), dtype=np.intp)
+    neighbours = np.empty((vertex_count, k), dtype=np.intp)
+    columns = np.arange(vertex_count)
+    for start in range(0, vertex_count, rows):
+        block = columns[start:start + rows]
+        costs = np.array(map_matrix[block[:, None], columns], dtype=np.float64)
+        costs[np.arange(len(block)), block] = np.inf
+        nearest = np.argpartition(costs, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(costs, nearest, axis=1), axis=1, kind='stable')
+        neighbours[start:start + rows] = np.take_along_axis(nearest, order, axis=1)
+    return neighbours
+
+class RemainingVertices:
+    # Unvisited vertices of a route under construction, for the nearest vertex fallback
+    # (every neighbour of the current vertex is visited): the unvisited index array is compacted
+    # at each fallback, removing only the vertices appended to the route since the previous one
+    # -> no rebuild from the visited list, each vertex is removed once
+    def __init__(self, route, vertex_count):
+        self.route = route # Route being built (appended by the caller)
+        self.visited = np.zeros(vertex_count, dtype=bool)
+        self.unvisited = np.arange(vertex_count)
+        self.synced = 0 # Vertices of the route already removed
+
+    def nearest(self, map_matrix, vertex):
+        self.visited[self.route[self.synced:]] = True
+        self.synced = len(self.route)
+        self.unvisited = self.unvisited[~self.visited[self.unvisited]]
+        # Row read: served by the row cache of a lazy distance (see distance.py)
+        return int(self.unvisited[np.argmin(map_matrix[vertex][self.unvisited])])
+
+def sequential_constructive_crossover(parent_a, parent_b, map_matrix, neighbours, child, start=None):
+    # Sequential Constructive Crossover (SCX): from the current vertex, take the
+    # cheaper of the legitimate (not visited) successors of the vertex in both parents.
+    # If a successor is already visited, the legitimate node is the nearest
+    # unvisited vertex (from the sorted neighbour list, else the nearest of the remaining vertices)
+    # Return the cost of the child: the costs of the chosen edges are read anyway
+    parent_a = np.asarray(parent_a).tolist()
+    parent_b = np.asarray(parent_b).tolist()
+    vertex_count = len(parent_a)
+    successor_a = [0] * vertex_count
+    successor_b = [0] * vertex_count
+    for i in range(vertex_count):
+        successor_a[parent_a[i - 1]] = parent_a[i]
+        successor_b[parent_b[i - 1]] = parent_b[i]
+    visited = [False] * vertex_count
+    checked = [0] * vertex_count # Neighbours already known to be visited, per vertex
+
+    def nearest_unvisited(vertex):
+        candidates = neighbours[vertex]
+        k = checked[vertex]
+        while k < len(candidates) and visited[candidates[k]]:
+            k += 1
+        checked[vertex] = k
+        if k < len(candidates):
+            return candidates[k]
+        return remaining.nearest(map_matrix, vertex)
+
+    vertex = parent_a[0] if start is None else start
+    visited[vertex] = True
+    route = [vertex]
+    remaining = RemainingVertices(route, vertex_count)
+    cost = 0.0
+    for _ in range(vertex_count - 1):
+        next_a = successor_a[vertex]
+        if visited[next_a]:
+            next_a = nearest_unvisited(vertex)
+        next_b = successor_b[vertex]
+        if visited[next_b]:
+            next_b = nearest_unvisited(vertex)
+        cost_a = map_matrix[vertex, next_a]
+        cost_b = map_matrix[vertex, next_b]
+        if cost_a <= cost_b:
+            vertex, cost = next_a, cost + cost_a
+        else:
+            vertex, cost = next_b, cost + cost_b
+        visited[vertex] = True
+        route.append(vertex)
+    child[:] = route
+    return float(cost + map_matrix[vertex, route[0]])
+
+def random_cut_points(count, vertex_count, rng=None):
+    # Same distribution as TSP.crossover: 1 <= first < second <= vertex_count
+    rng = default_rng(rng)
+    first_points = rng.integers(1, vertex_count, size=count)
+    second_points = rng.integers(first_points, vertex_count) + 1
+    return first_points, second_points
+
+def partially_mapped_crossover_batch(parents_a, parents_b, first_points, second_points):
+    # PMX of many pairs at once (one pair per row): take parent B's segment, then
+    # genes of parent A that clash with it follow the mapping B[i] -> A[i] until they don't
+    parents_a = np.asarray(parents_a)
+    parents_b = np.asarray(parents_b)
+    rows = np.arange(len(parents_a))[:, None]
+    columns = np.arange(parents_a.shape[1])
+    segment = (columns >= first_points[:, None]) & (columns < second_points[:, None])
+    position_b = np.empty_like(parents_b, dtype=np.intp)
+    position_b[rows, parents_b] = columns
+    children = np.where(segment, parents_b, parents_a)
+    clash = ~segment & segment[rows, position_b[rows, children]]
+    # Follow the mapping only on the genes that still clash
+    r, k = np.nonzero(clash)
+    while len(r):
+        children[r, k] = parents_a[r, position_b[r, children[r, k]]]
+        still = segment[r, position_b[r, children[r, k]]]
+        r, k = r[still], k[still]
+    return children
+
+def ordered_crossover_batch(parents_a, parents_b, first_points, second_points):
+    # OX of many pairs at once (one pair per row): a stable sort on the segment masks
+    # lists the free positions and parent B's remaining genes in order
+    parents_a = np.asarray(parents_a)
+    parents_b = np.asarray(parents_b)
+    rows = np.arange(len(parents_a))[:, None]
+    columns = np.arange(parents_a.shape[1])
+    segment = (columns >= first_points[:, None]) & (columns < second_points[:, None])
+    in_segment = np.zeros(parents_a.shape, dtype=bool)
+    in_segment[rows, parents_a] = segment
+    free_positions = np.argsort(segment, axis=1, kind='stable')
+    remaining = np.argsort(in_segment[rows, parents_b], axis=1, kind='stable')
+    children = np.empty_like(parents_a)
+    # The first (n - segment length) entries of both orders match,
+    # the others land on the segment and are overwritten below
+    children[rows, free_positions] = parents_b[rows, remaining]
+    children[segment] = parents_a[segment]
+    return children
+
+def crossover_batch(parents_a, parents_b, operator=PARTIALLY_MAPPED_CROSSOVER, map_matrix=None, neighbours=None, rng=None):
+    # Cross every pair (row) of parents, return the two matrices of children
+    if operator == SEQUENTIAL_CONSTRUCTIVE_CROSSOVER:
+        # No vectorized SCX (each step depends on the previous one) -> one pair after another
+        if neighbours is None:
+            neighbours = neighbour_lists(map_matrix).tolist()
+        children_c = np.empty_like(parents_a)
+        children_d = np.empty_like(parents_b)
+        for parent_a, parent_b, child_c, child_d in zip(parents_a, parents_b, children_c, children_d):
+            sequential_constructive_crossover(parent_a, parent_b, map_matrix, neighbours, child_c)
+            sequential_constructive_crossover(parent_b, parent_a, map_matrix, neighbours, child_d)
+        return children_c, children_d
+    first_points, second_points = random_cut_points(len(parents_a), np.shape(parents_a)[1], rng)
+    if operator == PARTIALLY_MAPPED_CROSSOVER:
+        crossover = partially_mapped_crossover_batch
+    elif operator == ORDERED_CROSSOVER:
+        crossover = ordered_crossover_batch
+    else:
+        raise ValueError(f'No batched version of {operator}')
+    return crossover(parents_a, parents_b, first_points, second_points), \
+           crossover(parents_b, parents_a, first_points, second_points)
+
+def mutation_batch(routes, operator=SINGLE_SWAP_MUTATION, rng=None):
+    # Mutate every route (row) in place, same distributions as TSP.mutation.
+    # The fitness is not updated: the routes are evaluated afterwards (see batch_fitness)
+    rng = default_rng(rng)
+    count, vertex_count = routes.shape
+    rows = np.arange(count)
+    if operator == SINGLE_SWAP_MUTATION:
+        first_indices, second_indices = rng.integers(0, vertex_count, size=(2, count))
+        routes[rows, first_indices], routes[rows, second_indices] = \
+            routes[rows, second_indices], routes[rows, first_indices]
+    elif operator == INVERSION:
+        # Reverse route[first:second] of every row through a map of the source columns
+        first_indices = rng.integers(0, vertex_count - 1, size=count)[:, None]
+        second_indices = rng.integers(first_indices + 1, vertex_count)
+        columns = np.arange(vertex_count)
+        inverted = (columns >= first_indices) & (columns < second_indices)
+        source = np.where(inverted, first_indices + second_indices - 1 - columns, columns)
+        routes[:] = np.take_along_axis(routes, source, axis=1)
+    else:
+        raise ValueError(f'No batched version of {operator}')
+    return routes
 
 class TSP:
+    # Solution of the problem: a route and its fitness (total cost).
+    # The route can be a list or a row of the population matrix (see Population),
+    # in which case the TSP is only a view on that row.
     route = []
     map_matrix = []
     vertex_count = 0
+    fitness = None
 
-    def __init__(self, map_matrix, route=None):
+    def __init__(self, map_matrix, route=None, fitness=None, evaluate=True, rng=None):
         self.map_matrix = map_matrix
         self.vertex_count = len(map_matrix)
-        if route:
+        if route is not None:
             self.route = route # Add route
         else:
-            self.generate_random_solution() # Generate random solution (route)
-        self.calculate_fitness() # Calculate fitness
+            self.generate_random_solution(rng) # Generate random solution (route)
+        if fitness is not None:
+            self.fitness = fitness # Fitness is already known
+        elif evaluate:
+            self.calculate_fitness() # Calculate fitness
 
     def __str__(self):
-        route = str(self.route)[1:-1].replace(',', ' ->')
+        route = str(np.asarray(self.route).tolist())[1:-1].replace(',', ' ->')
         return f'Solution {route} - fitness {self.fitness}'
 
     def __gt__(self, other):
@@ -32,110 +308,82 @@ class TSP:
         # Compare fitness between solution: >=
         return self.fitness >= other.fitness
 
-    def generate_random_solution(self):
-        self.route = []
-        # Stop when travelling through all vertices
-        while len(self.route) < self.vertex_count:
-            random_vertex = random.randint(0, self.vertex_count - 1)
-            # If vertex is not visited, add vertex to the solution
-            if not (random_vertex in self.route):
-                self.route.append(random_vertex)
+    def copy(self):
+        # Detached copy (list route) that is safe to keep after the population changes
+        return TSP(self.map_matrix, np.asarray(self.route).tolist(), fitness=self.fitness, evaluate=False)
 
-    def calculate_fitness(self):
-        self.fitness = 0
-        for i in range(1, self.vertex_count):
-            # Add edge cost to the fitness
-            self.fitness += self.map_matrix[self.route[i - 1]][self.route[i]]
+    def generate_random_solution(self, rng=None):
+        self.route = random_route(self.vertex_count, rng)
 
-        self.fitness += self.map_matrix[self.route[-1]][self.route[0]]
+    def calculate_fitness(self):
+        # Sum of all edge costs, including the edge back to the first vertex
+        route = np.asarray(self.route)
+        self.fitness = float(self.map_matrix[route, np.roll(route, -1)].sum())
         return self.fitness
 
-    def mutation(self, operator):
-        new_solution = []
+    def mutation(self, operator, verify=VERIFY_DELTA_EVALUATION, rng=None):
+        # Mutate the route in place
+        rng = default_rng(rng)
+        delta = 0
         # Single swap mutation
         if operator == SINGLE_SWAP_MUTATION:
-            new_solution = swap_gene(self.route) # Swap two random vertices
+            # Choose two random genes
+            first_index = random_index(rng, 0, self.vertex_count)
+            second_index = random_index(rng, 0, self.vertex_count)
+            if self.fitness is not None:
+                delta = swap_delta(self.map_matrix, self.route, first_index, second_index)
+            # Swap two random vertices
+            self.route[first_index], self.route[second_index] = self.route[second_index], self.route[first_index]
         # Inversion mutation
         elif operator == INVERSION:
             # Choose two random indices
-            first_index = random.randint(0, self.vertex_count - 2)
-            second_index = random.randint(first_index + 1, self.vertex_count - 1)
-
-            try:
-                if first_index < second_index:
-                    # Reverse route from first index to second index
-                    inverse = self.route[first_index:second_index]
-                    inverse.reverse()
-                    new_solution = self.route[:first_index] + inverse + self.route[second_index:]
-            except:
-                # Exception -> reverse the whole solution
-                new_solution = self.route.copy()
-                new_solution.reverse()
-
-        return TSP(self.map_matrix, new_solution)
-
-    def crossover(self, other_tsp, operator=PARTIALLY_MAPPED_CROSSOVER):
-        parent_a = self.route.copy()
-        parent_b = other_tsp.route.copy()
-        child_c = None
-        child_d = None
-        first_point_subset = random.randint(1, self.vertex_count - 1)
-        second_point_subset = random.randint(first_point_subset, self.vertex_count - 1) + 1
+            first_index = random_index(rng, 0, self.vertex_count - 1)
+            second_index = random_index(rng, first_index + 1, self.vertex_count)
+            if self.fitness is not None:
+                delta = inversion_delta(self.map_matrix, self.route, first_index, second_index)
+            # Reverse route from first index to second index
+            self.route[first_index:second_index] = self.route[first_index:second_index][::-1]
+
+        # Unknown fitness -> fitness is evaluated later in batch (see EA.evaluate)
+        if self.fitness is None:
+            return self
+        # Incremental evaluation: previous fitness + cost of the changed edges
+        self.fitness += delta
+        if verify:
+            expected = self.fitness
+            if not np.isclose(self.calculate_fitness(), expected):
+                raise RuntimeError(f'{operator}: delta evaluation {expected} does not match full evaluation {self.fitness}')
+        return self
+
+    def crossover(self, other_tsp, child_c, child_d, operator=PARTIALLY_MAPPED_CROSSOVER, neighbours=None, rng=None):
+        # Write the children routes in place into child_c and child_d (e.g. scratch rows)
+        # neighbours: sorted neighbour lists used by SCX (see neighbour_lists)
+        parent_a = self.route
+        parent_b = other_tsp.route
+        route_c = child_c.route
+        route_d = child_d.route
+        rng = default_rng(rng)
+        first_point_subset = random_index(rng, 1, self.vertex_count)
+        second_point_subset = random_index(rng, first_point_subset, self.vertex_count) + 1
         # Partially matched crossover
         if operator == PARTIALLY_MAPPED_CROSSOVER:
-            child_c = parent_a.copy()
-            child_d = parent_b.copy()
-            for i in range(first_point_subset, second_point_subset):
-                # Partially mapped crossover (PMX)
-                swap_gene(child_c, child_c.index(parent_b[i]), i)
-                swap_gene(child_d, child_d.index(parent_a[i]), i)
-                # cross data
-                child_c[i] = parent_b[i]
-                child_c[child_c.index(child_c[i])] = parent_a[i]
-                # cross data
-                child_d[i] = parent_a[i]
-                child_d[child_d.index(child_d[i])] = parent_b[i]
+            partially_mapped_crossover(parent_a, parent_b, first_point_subset, second_point_subset, route_c)
+            partially_mapped_crossover(parent_b, parent_a, first_point_subset, second_point_subset, route_d)
         # Sequential constructive crossover
         elif operator == SEQUENTIAL_CONSTRUCTIVE_CROSSOVER:
-            flag = [False for _ in range(self.vertex_count)]
-            index = 0
-            flag[index] = True
-            while not flag[parent_a.index(parent_b[index])]:
-                index = parent_a.index(parent_b[index])
-                flag[index] = True
-            child_c = []
-            child_d = []
-            for i in range(self.vertex_count):
-                if flag[i]:
-                    child_c.append(parent_a[i])
-                    child_d.append(parent_b[i])
-                else:
-                    child_c.append(parent_b[i])
-                    child_d.append(parent_a[i])
-
-
+            if neighbours is None:
+                neighbours = neighbour_lists(self.map_matrix).tolist()
+            # One child starts from the first vertex of each parent
+            # The children are evaluated by the crossover -> O(1) delta evaluation of their mutation
+            child_c.fitness = sequential_constructive_crossover(parent_a, parent_b, self.map_matrix, neighbours, route_c)
+            child_d.fitness = sequential_constructive_crossover(parent_b, parent_a, self.map_matrix, neighbours, route_d)
+            return child_c, child_d
         # Ordered crossover
-        elif operator == ORDERED_CROSSOVER:    
-            subset_parent_a = parent_a[first_point_subset:second_point_subset]
-            subset_parent_b = parent_b[first_point_subset:second_point_subset]
-
-            before_subset_a = []
-            before_subset_b = []
-
-            for i in range(self.vertex_count):
-                if not parent_b[i] in subset_parent_a:
-                    if len(before_subset_a) < first_point_subset:
-                        before_subset_a.append(parent_b[i])
-                    else:
-                        subset_parent_a.append(parent_b[i])
-
-                if not parent_a[i] in subset_parent_b:
-                    if len(before_subset_a) < first_point_subset:
-                        before_subset_b.append(parent_a[i])
-                    else:
-                        subset_parent_b.append(parent_a[i])
-
-            child_c = before_subset_a + subset_parent_a
-            child_d = before_subset_b + subset_parent_b
-
-        return TSP(self.map_matrix, child_c), TSP(self.map_matrix, child_d)
+        elif operator == ORDERED_CROSSOVER:
+            ordered_crossover(parent_a, parent_b, first_point_subset, second_point_subset, route_c)
+            ordered_crossover(parent_b, parent_a, first_point_subset, second_point_subset, route_d)
+
+        # Children are only used as input of the mutation -> evaluated after it (see EA.evaluate)
+        child_c.fitness = None
+        child_d.fitness = None
+        return child_c, child_d
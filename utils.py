@@ -1,10 +1,6 @@
 import csv
 import os
-import random
-import seaborn as sns
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-from matplotlib.lines import Line2D
+from tsp import default_rng, random_index
 from constants import PARTIALLY_MAPPED_CROSSOVER, ORDERED_CROSSOVER, SEQUENTIAL_CONSTRUCTIVE_CROSSOVER
 from constants import REPLACE_FIRST_WEAKEST, REPLACE_WEAKEST
 from constants import SINGLE_SWAP_MUTATION, INVERSION
@@ -37,21 +33,27 @@ def best_fitness(population):
             result = solution
     return result
 
-def swap_gene(chromosome, gene1=None, gene2=None):
+def swap_gene(chromosome, gene1=None, gene2=None, rng=None):
     new_solution = chromosome.copy()
     # choose two random genes
-    # If there are none given gene
-    if not gene1:
-        gene1 = random.randint(0, len(new_solution) - 1)
-    if not gene2:
-        gene2 = random.randint(0, len(new_solution)- 1)
+    # If there are none given gene (rng: generator of the run, see tsp.default_rng)
+    rng = default_rng(rng)
+    if gene1 is None:
+        gene1 = random_index(rng, 0, len(new_solution))
+    if gene2 is None:
+        gene2 = random_index(rng, 0, len(new_solution))
     # Swap
     temp = new_solution[gene1]
     new_solution[gene1] = new_solution[gene2]
     new_solution[gene2] = temp
     return new_solution
 
+# Plotting libraries are imported by the visualize functions only (slow import,
+# not needed by the solver: see render.py)
+
 def visualize_population_and_tournament_size_comparision(file, report):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     # Only filtered combination of operators to compare:
     # - Sequential Constructive Crossover
     # - Inversion Mutation
@@ -101,6 +103,8 @@ def visualize_population_and_tournament_size_comparision(file, report):
     plt.close()
 
 def visualize_summary_graph(file, report):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     fig, ax = plt.subplots(1, 2, figsize=(12, 8))
     fig.suptitle(f"Final Summary", wrap=True)
 
@@ -138,6 +142,10 @@ def visualize_summary_graph(file, report):
     
 
 def visualize_operators_comparision(file, report):
+    import matplotlib.pyplot as plt
+    import matplotlib.gridspec as gridspec
+    import seaborn as sns
+    from matplotlib.lines import Line2D
     fig = plt.figure(figsize=(10, 10))
     gs = gridspec.GridSpec(2, 2)
     ax1 = plt.subplot(gs[:, 1])
@@ -214,36 +222,21 @@ def visualize_operators_comparision(file, report):
     plt.close()
 
 def generate_summary_report(file, report):
-    if os.path.exists(file):
-        with open(file, 'r', newline='') as f:
-            reader = csv.reader(f)
-            flag = True
-            for row in reader:
-                # Pass first row
-                if flag:
-                    flag = False
-                    continue
-                # Change data from string to float
-                # to sort and plot graph
-                row[-1] = float(row[-1])
-                row[-2] = float(row[-2])
-                report.append(row)
-
-
-    # Write all record data of experimentations into csv file (sort by Fitness & Generation that achieve best fitness)
-    with open(file, mode='w', newline='') as f:
+    # Append the record data of the new experimentations to the csv file
+    # (the sorted report of all the experimentations is in the results store, see results.py)
+    new_file = not os.path.exists(file)
+    with open(file, mode='a', newline='') as f:
         writer = csv.writer(f)
         # Final report columns
-        writer.writerow(['No.',
-                         'Population Size',
-                         'Tournament Size',
-                         'Replacement Function',
-                         'Mutation Function',
-                         'Crossover Function',
-                         'Execution Time',
-                         'Optimize route',
-                         'Best Fitness' ,
-                         'Generation that achieve best fitness'])
-        # Open and read the CSV file
-        report.sort(key=lambda data: (data[-2], data[-1]))
+        if new_file:
+            writer.writerow(['No.',
+                             'Population Size',
+                             'Tournament Size',
+                             'Replacement Function',
+                             'Mutation Function',
+                             'Crossover Function',
+                             'Execution Time',
+                             'Optimize route',
+                             'Best Fitness' ,
+                             'Generation that achieve best fitness'])
         writer.writerows(report)